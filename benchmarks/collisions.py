@@ -0,0 +1,173 @@
+"""
+Benchmark the enemy collision test against broad phases that skip far-away enemies
+Usage: python -m benchmarks.collisions [--enemies 10 50 200 1000] [--output results.json]
+Each tick, every method is given the moved enemies and tests the players against them: `brute` is
+    `EnemyField.collisions` (every enemy against every player), `grid` keeps a uniform grid of cells up to date and
+    only tests the enemies in the cells a player covers, `sweep` sorts the enemies along x and only tests those whose
+    x range overlaps a player
+"""
+import argparse
+import numpy as np
+
+from benchmarks.common import measure, summarize, machine_info, save_results, print_results
+from utils.game import EnemyField
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--enemies', type=int, nargs='+', default=[10, 50, 200, 1000], help='Numbers of enemies to test')
+parser.add_argument('--players', type=int, default=2, help='Number of players tested against the enemies')
+parser.add_argument('--ticks', type=int, default=300, help='Number of simulated ticks per run')
+parser.add_argument('--cell_size', type=int, default=100, help='Size of the grid cells, in pixels')
+parser.add_argument('--repeat', type=int, default=3, help='Number of passes over the ticks')
+parser.add_argument('--output', default=None, help='Where to write the results (.json)')
+
+
+def simulate(num_enemies, num_ticks, window_size=(600, 1000), speed=3, seed=0):
+    """
+    Enemies shaped like those of the levels (bars 50 pixels thick) moving along one axis, wrapped around the
+        playing field so that their number stays constant
+    :return: (n, 2) sizes and a list of (n, 2) positions, one per tick
+    """
+    rng = np.random.default_rng(seed)
+    window = np.array(window_size, dtype='float64')
+    vertical = rng.random(num_enemies) < 0.5
+    length = rng.uniform(50, 300, num_enemies)
+    size = np.where(vertical[:, None], np.stack([np.full(num_enemies, 50.), length], 1),
+                    np.stack([length, np.full(num_enemies, 50.)], 1))
+    direction = rng.choice([-1., 1.], num_enemies)
+    vel = np.where(vertical[:, None], np.stack([direction * speed, np.zeros(num_enemies)], 1),
+                   np.stack([np.zeros(num_enemies), direction * speed], 1))
+    pos = rng.uniform(0, 1, (num_enemies, 2)) * window
+    positions = []
+    for _ in range(num_ticks):
+        pos = (pos + vel) % window
+        positions.append(pos.copy())
+    return size, positions
+
+
+class BruteForce:
+    def __init__(self, size, rects):
+        self.field = EnemyField([600, 1000], capacity=max(len(size), 1))
+        self.field.add(np.concatenate([np.zeros_like(size), size, np.zeros_like(size)], axis=1))
+        self.rects = rects
+
+    def __call__(self, pos):
+        self.field.pos[:len(pos)] = pos
+        return self.field.collisions(self.rects)
+
+
+class UniformGrid:
+    """
+    Enemies bucketed by the cell of their top-left corner in a dict of sets, only the enemies that changed cells are
+        moved between buckets; players look up the cells they cover, widened by the largest enemy
+    """
+    def __init__(self, size, rects, cell_size=100):
+        self.size = size
+        self.rects = rects
+        self.cell_size = cell_size
+        self.reach = size.max(axis=0) if len(size) else np.zeros(2)
+        self.cells = None
+        self.buckets = {}
+
+    def update(self, pos):
+        cells = (pos // self.cell_size).astype(int)
+        if self.cells is None:
+            changed = np.arange(len(pos))
+        else:
+            changed = np.flatnonzero((cells != self.cells).any(axis=1))
+        for i in changed:
+            if self.cells is not None:
+                self.buckets[tuple(self.cells[i])].discard(i)
+            self.buckets.setdefault(tuple(cells[i]), set()).add(i)
+        self.cells = cells
+
+    def __call__(self, pos):
+        self.update(pos)
+        hits = np.zeros(len(self.rects), dtype=bool)
+        for k, (x, y, width, height) in enumerate(self.rects):
+            x0, y0 = int((x - self.reach[0]) // self.cell_size), int((y - self.reach[1]) // self.cell_size)
+            x1, y1 = int((x + width) // self.cell_size), int((y + height) // self.cell_size)
+            candidates = [
+                i for cx in range(x0, x1 + 1) for cy in range(y0, y1 + 1) for i in self.buckets.get((cx, cy), ())
+            ]
+            if candidates:
+                p, s = pos[candidates], self.size[candidates]
+                hits[k] = (
+                    (p[:, 0] < x + width) & (x < p[:, 0] + s[:, 0]) & (p[:, 1] < y + height) & (y < p[:, 1] + s[:, 1])
+                ).any()
+        return hits
+
+
+class SweepAndPrune:
+    """
+    Enemies sorted by their left edge, players only test those starting less than the widest enemy to their left
+    """
+    def __init__(self, size, rects):
+        self.size = size
+        self.rects = rects
+        self.reach = size[:, 0].max() if len(size) else 0.
+
+    def __call__(self, pos):
+        order = np.argsort(pos[:, 0], kind='stable')
+        xs = pos[order, 0]
+        hits = np.zeros(len(self.rects), dtype=bool)
+        for k, (x, y, width, height) in enumerate(self.rects):
+            candidates = order[np.searchsorted(xs, x - self.reach):np.searchsorted(xs, x + width)]
+            p, s = pos[candidates], self.size[candidates]
+            hits[k] = (
+                (p[:, 0] < x + width) & (x < p[:, 0] + s[:, 0]) & (p[:, 1] < y + height) & (y < p[:, 1] + s[:, 1])
+            ).any()
+        return hits
+
+
+def player_rects(num_players, window_size=(600, 1000), size=50):
+    # Spread across the field as in `Simulation`
+    return np.array([
+        [window_size[0] * (i + 1) // (num_players + 1) - size // 2, window_size[1] // 2 - size // 2, size, size]
+        for i in range(num_players)
+    ], dtype='float64')
+
+
+def make_methods(size, rects, cell_size=100):
+    return {
+        'brute': BruteForce(size, rects),
+        'grid': UniformGrid(size, rects, cell_size),
+        'sweep': SweepAndPrune(size, rects)
+    }
+
+
+def run_benchmarks(enemy_counts, num_players=2, num_ticks=300, cell_size=100, repeat=3):
+    rects = player_rects(num_players)
+    stages = {}
+    for num_enemies in enemy_counts:
+        size, positions = simulate(num_enemies, num_ticks)
+
+        # Every method must find the same collisions (on fresh instances, the grid keeps state between ticks)
+        for name, method in make_methods(size, rects, cell_size).items():
+            for tick, pos in enumerate(positions):
+                if not np.array_equal(method(pos), BruteForce(size, rects)(pos)):
+                    raise AssertionError(f'`{name}` disagrees with `brute` at tick {tick} with {num_enemies} enemies')
+
+        methods = make_methods(size, rects, cell_size)
+        for name, method in methods.items():
+            stages[f'{name}/{num_enemies}'] = measure(method, positions, repeat)
+
+    return {
+        'machine': machine_info(),
+        'players': num_players,
+        'ticks': num_ticks,
+        'cell_size': cell_size,
+        'stages': {name: summarize(latencies) for name, latencies in stages.items()}
+    }
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.enemies, args.players, args.ticks, args.cell_size, args.repeat)
+    print(f'{results["players"]} players, {results["ticks"]} ticks, latency per tick')
+    print_results(results)
+
+    if args.output is not None:
+        save_results(results, args.output)
+        print('Results saved at', args.output)
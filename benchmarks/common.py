@@ -0,0 +1,89 @@
+import json
+import time
+import platform
+import numpy as np
+
+
+def measure(fn, inputs, repeat=1, warmup=5):
+    """
+    Time a function on each input
+    :param fn: function taking a single input
+    :param inputs: list of inputs, the function is timed once per input per repetition
+    :param repeat: number of passes over the inputs
+    :param warmup: number of untimed calls made before measuring
+    :return: 1-D array of latencies in seconds
+    """
+    for x in inputs[:warmup]:
+        fn(x)
+
+    latencies = []
+    for _ in range(repeat):
+        for x in inputs:
+            start = time.perf_counter()
+            fn(x)
+            latencies.append(time.perf_counter() - start)
+    return np.asarray(latencies)
+
+
+def summarize(latencies):
+    # Latencies are reported in milliseconds, throughput in calls per second
+    latencies = np.asarray(latencies)
+    if len(latencies) == 0:
+        return {'count': 0}
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) * 1000
+    return {
+        'count': int(len(latencies)),
+        'mean_ms': float(latencies.mean() * 1000),
+        'p50_ms': float(p50),
+        'p95_ms': float(p95),
+        'p99_ms': float(p99),
+        'throughput': float(len(latencies) / latencies.sum())
+    }
+
+
+def machine_info():
+    return {
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+        'python': platform.python_version(),
+        'numpy': np.__version__
+    }
+
+
+def save_results(results, path):
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2)
+
+
+def compare(results, baseline, tolerance=0.1, metrics=('p50_ms', 'p95_ms')):
+    """
+    Compare stage latencies against a saved baseline
+    :param results: results of the current run
+    :param baseline: results of a previous run
+    :param tolerance: allowed relative slowdown before a metric is flagged
+    :param metrics: latency metrics to compare
+    :return: list of (stage, metric, baseline value, current value) that regressed
+    """
+    regressions = []
+    for stage, stats in results['stages'].items():
+        base_stats = baseline['stages'].get(stage)
+        if base_stats is None:
+            continue
+        for metric in metrics:
+            if metric not in stats or metric not in base_stats:
+                continue
+            if stats[metric] > base_stats[metric] * (1 + tolerance):
+                regressions.append((stage, metric, base_stats[metric], stats[metric]))
+    return regressions
+
+
+def print_results(results):
+    print(f'{"stage":<20}{"count":>8}{"p50 ms":>10}{"p95 ms":>10}{"p99 ms":>10}{"per sec":>12}')
+    for stage, stats in results['stages'].items():
+        if stats['count'] == 0:
+            print(f'{stage:<20}{0:>8}')
+            continue
+        print(
+            f'{stage:<20}{stats["count"]:>8}{stats["p50_ms"]:>10.3f}{stats["p95_ms"]:>10.3f}'
+            f'{stats["p99_ms"]:>10.3f}{stats["throughput"]:>12.1f}'
+        )
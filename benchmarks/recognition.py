@@ -0,0 +1,125 @@
+"""
+Benchmark the stages of the gesture recognition hot path on stored frames (no camera needed)
+Usage: python -m benchmarks.recognition --frames_dir <dir> [--output results.json] [--baseline baseline.json]
+Without recorded frames, `--synthetic N` benchmarks a deterministic set of generated frames instead
+"""
+import argparse
+import os
+import sys
+import json
+import cv2
+import numpy as np
+
+from benchmarks.common import measure, summarize, machine_info, save_results, compare, print_results
+from utils.images import process_frame, FramePreprocessor
+from utils.models import GestureRecognizer
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument(
+    '--frames_dir', default='benchmarks/frames',
+    help='Directory of recorded 224x224 frames (BGR, as saved by OpenCV)'
+)
+parser.add_argument(
+    '--synthetic', type=int, default=None,
+    help='Benchmark this many deterministic generated frames instead of `--frames_dir`'
+)
+parser.add_argument('--model_path', default='saved_models/left_neutral_right.npz', help='Classifier to benchmark')
+parser.add_argument('--repeat', type=int, default=3, help='Number of passes over the frames')
+parser.add_argument('--output', default=None, help='Where to write the results (.json)')
+parser.add_argument('--baseline', default=None, help='Results of a previous run to compare against')
+parser.add_argument(
+    '--tolerance', type=float, default=0.1,
+    help='Relative slowdown against the baseline that is flagged as a regression'
+)
+
+
+def load_frames(frames_dir, target_size=(224, 224)):
+    if not os.path.isdir(frames_dir):
+        return []
+    frames = []
+    for name in sorted(os.listdir(frames_dir)):
+        frame = cv2.imread(os.path.join(frames_dir, name))
+        if frame is None:
+            continue
+        if frame.shape[:2] != target_size:
+            raise ValueError(f'Frame `{name}` has shape {frame.shape}, expected {target_size}')
+        frames.append(frame)
+    return frames
+
+
+def synthetic_frames(num_frames, target_size=(224, 224), seed=0):
+    """
+    Deterministic frames for machines without recorded ones: a skin-colored palm and fingers over a noisy
+        background, moved and rotated a little from frame to frame
+    Results are comparable between runs and machines, but not with results on recorded frames
+    """
+    rng = np.random.default_rng(seed)
+    h, w = target_size
+    frames = []
+    for i in range(num_frames):
+        frame = rng.integers(40, 90, (h, w, 3), dtype='uint8')
+        cx, cy = w // 2 + int(rng.integers(-20, 21)), h // 2 + 30 + int(rng.integers(-20, 21))
+        skin = (110, 150, 210)  # BGR
+        cv2.ellipse(frame, (cx, cy), (40, 50), 0, 0, 360, skin, -1)
+        for k, angle in enumerate(np.linspace(-50, 50, 5) + 10 * np.sin(i / 5)):
+            length = 70 if 0 < k < 4 else 50
+            end = (int(cx + length * np.sin(np.radians(angle))), int(cy - 40 - length * np.cos(np.radians(angle))))
+            cv2.line(frame, (cx, cy - 30), end, skin, 14)
+        frames.append(frame)
+    return frames
+
+
+def run_benchmarks(frames, recognizer, repeat=3):
+    stages = {}
+    images = [process_frame(frame) for frame in frames]
+
+    stages['process_frame'] = measure(process_frame, frames, repeat)
+    stages['frame_preprocessor'] = measure(FramePreprocessor(), frames, repeat)
+    stages['predict_landmarks'] = measure(recognizer.predict_landmarks, images, repeat)
+    stages['image2vec'] = measure(recognizer.image2vec, images, repeat)
+
+    # Only frames with a detected hand reach the classifier
+    vecs = [vec for vec in (recognizer.image2vec(image) for image in images) if vec is not None]
+    stages['classify'] = measure(recognizer.classify, vecs, repeat)
+    stages['predict_image'] = measure(recognizer.predict_image, images, repeat)
+
+    return {
+        'machine': machine_info(),
+        'num_frames': len(frames),
+        'detected_frames': len(vecs),
+        'stages': {name: summarize(latencies) for name, latencies in stages.items()}
+    }
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+
+    if args.synthetic is not None:
+        frames = synthetic_frames(args.synthetic)
+    else:
+        frames = load_frames(args.frames_dir)
+    if not frames:
+        sys.exit(f'No frames found in {args.frames_dir}, record some or use `--synthetic N`')
+    recognizer = GestureRecognizer.load(args.model_path)
+
+    results = run_benchmarks(frames, recognizer, args.repeat)
+    results['model_path'] = args.model_path
+    results['frames'] = f'synthetic ({args.synthetic})' if args.synthetic is not None else args.frames_dir
+    print(f'{results["num_frames"]} frames, {results["detected_frames"]} with a detected hand')
+    print_results(results)
+
+    if args.output is not None:
+        save_results(results, args.output)
+        print('Results saved at', args.output)
+
+    # Flag regressions against a previous run
+    if args.baseline is not None:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        for stage, metric, base_value, value in regressions:
+            print(f'REGRESSION {stage} {metric}: {base_value:.3f} -> {value:.3f}')
+        if regressions:
+            sys.exit(1)
+        print('No regressions against', args.baseline)
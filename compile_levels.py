@@ -0,0 +1,34 @@
+import argparse
+from itertools import islice
+
+from utils.levels import read_level_csv, random_level_rows, compile_rows, write_level
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--levels', default='levels.csv', help='Level CSV to compile')
+parser.add_argument('--output', default='levels.bin', help='Where to save the compiled level')
+parser.add_argument('--window_size', type=int, nargs=2, default=[600, 1000], help='Window size of the game')
+parser.add_argument('--spawn_interval', type=int, default=3000, help='Time between two rows, in milliseconds')
+parser.add_argument('--speed', type=int, default=3, help='Enemy speed, in pixels per tick')
+parser.add_argument(
+    '--random_rows', type=int, default=None,
+    help='Compile a procedurally generated level with this many rows instead of `--levels`'
+)
+parser.add_argument('--seed', type=int, default=None, help='Seed of the procedurally generated level')
+parser.add_argument(
+    '--directions', type=int, nargs='+', default=[0, 1], choices=[0, 1, 2, 3],
+    help='Enemy types of the procedurally generated level: 0 down, 1 up, 2 right, 3 left'
+)
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+
+    if args.random_rows is not None:
+        rows = islice(random_level_rows(seed=args.seed, directions=args.directions), args.random_rows)
+    else:
+        rows = read_level_csv(args.levels)
+
+    chunks = compile_rows(rows, args.window_size, args.spawn_interval, args.speed)
+    count = write_level(chunks, args.output, args.window_size)
+    print(f'Compiled {count} enemies to {args.output}')
@@ -1,13 +1,12 @@
 import argparse
 import cv2
-import numpy as np
 import os
-from tqdm import tqdm
-from datetime import datetime
-from uuid import uuid4
 
 from utils.datasets import load_configs
 from utils.images import process_frame
+from utils.sources import open_source
+from utils.packing import PackedDataset, is_packed
+from utils.writer import AsyncImageWriter, JpegSink, PackedSink
 
 
 parser = argparse.ArgumentParser()
@@ -19,6 +18,18 @@ parser.add_argument(
     '--save_dir',
     help='Location to save the dataset; can be a previously collected dataset'
 )
+parser.add_argument(
+    '--packed', action='store_true',
+    help='Append images to a packed (sharded) dataset instead of saving one JPEG file per image'
+)
+parser.add_argument(
+    '--source', default='0',
+    help='Camera index, video file, directory of frames or raw frame dump (.npy/.raw) to collect from'
+)
+parser.add_argument(
+    '--frame_shape', type=int, nargs=3, default=None, metavar=('H', 'W', 'C'),
+    help='Shape of the frames of a headerless raw frame dump (.raw), e.g. 480 640 3'
+)
 
 # Temporary measure, change later
 image_config = {
@@ -27,15 +38,16 @@ image_config = {
 }
 
 
-def collect_images():
+def collect_images(writer):
     """
-    Collect a batch of images from camera
-    :return: images, labels
+    Collect a batch of images from camera; images are saved in the background by `writer` while collecting
+    :param writer: AsyncImageWriter
+    :return: number of images collected
     """
 
-    images_batch, labels_batch = [], []
+    num_images = 0
     cv2.namedWindow('Collection')
-    capture = cv2.VideoCapture(0)
+    capture = open_source(source, frame_shape=frame_shape)
     ret, frame = capture.read()
 
     while ret:
@@ -51,63 +63,59 @@ def collect_images():
 
         # Backspace is pressed, delete last sample
         if key == 8:
-            images_batch.pop()
-            label = labels_batch.pop()
-            class_count[class_map[label]] -= 1
-            print('Class count:', class_count)
+            label = writer.cancel_last()
+            if label is not None:
+                num_images -= 1
+                class_count[class_map[label]] -= 1
+                print('Class count:', class_count)
 
         # Collect gestures based on key press:
         for k, label in key_map.items():
             if key == k:
                 image = process_frame(frame, **image_config)
-                images_batch.append(image)
-                labels_batch.append(label)
+                writer.submit(image, label)
+                num_images += 1
                 class_count[class_map[label]] += 1
                 print('Class count:', class_count)
 
-    images_batch = np.array(images_batch)
-    labels_batch = np.array(labels_batch)
-    return images_batch, labels_batch
-
-
-def save_images(images_batch, labels_batch):
-    """
-    Saves a batch of images according to their labels
-    File names are created based on generated time and unique ID
-    :param images_batch: batch of images
-    :param labels_batch: batch of labels
-    """
-    print("Saving batch of images:")
-    time_stamp = datetime.now().strftime('%Y%m-%d%H-%M-')
-    for image, label in tqdm(zip(images_batch, labels_batch), total=len(images_batch), ncols=80):
-        class_dir = os.path.join(save_dir, str(label))
-        file_name = time_stamp + str(uuid4()) + '.jpg'
-        # OpenCV saves image in BGR format
-        image = image[:, :, ::-1]
-        cv2.imwrite(os.path.join(class_dir, file_name), image)
+    return num_images
 
 
 if __name__ == '__main__':
     args = parser.parse_args()
     save_dir = args.save_dir
+    source = args.source
+    frame_shape = args.frame_shape
 
     # Load class and key maps
     class_map, key_map = load_configs(args.config_dir)
     class_count = {class_: 0 for class_ in class_map.values()}
 
     # Create save directory if it does not exist, count samples
-    os.makedirs(save_dir, exist_ok=True)
-    for class_ in class_map.keys():
-        class_dir = os.path.join(save_dir, str(class_))
-        os.makedirs(class_dir, exist_ok=True)
-        class_count[class_map[class_]] = len(os.listdir(class_dir))
+    packed = None
+    if args.packed or is_packed(save_dir):
+        packed = PackedDataset(save_dir, image_shape=(*image_config['target_size'], 3))
+        labels = packed.labels
+        for class_ in class_map.keys():
+            class_count[class_map[class_]] = int((labels == class_).sum())
+    else:
+        os.makedirs(save_dir, exist_ok=True)
+        for class_ in class_map.keys():
+            class_dir = os.path.join(save_dir, str(class_))
+            os.makedirs(class_dir, exist_ok=True)
+            class_count[class_map[class_]] = len(os.listdir(class_dir))
     print('Class count before collection:', class_count)
 
     # Collect and save images
+    sink = PackedSink(packed) if packed is not None else JpegSink(save_dir)
+    writer = AsyncImageWriter(sink)
     while True:
-        images, labels = collect_images()
-        save_images(images, labels)
+        num_images = collect_images(writer)
+        print(f'Saving batch of {num_images} images ({writer.pending} left to write)...', end=' ')
+        writer.flush()
+        print('Complete')
 
         continue_ = input('Continue collection? [y/n] >> ')
         if continue_.lower() == 'n':
             break
+    writer.close()
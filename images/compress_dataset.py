@@ -0,0 +1,21 @@
+import argparse
+import os
+import sys
+
+# Allow running as `python images/compress_dataset.py` from the repository root
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.packing import pack_directory
+
+
+parser = argparse.ArgumentParser(
+    description='Pack a dataset of JPEG files (one sub-directory per class) into memory-mapped shards'
+)
+parser.add_argument('--dataset_dir', help='Directory of the image dataset')
+parser.add_argument('--packed_dir', help='Where to store the packed dataset; images are appended if it exists')
+parser.add_argument('--shard_size', type=int, default=512, help='Maximum number of images per shard')
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    packed = pack_directory(args.dataset_dir, args.packed_dir, args.shard_size)
+    print(f'Packed dataset at {args.packed_dir}: {len(packed)} images in {len(packed.index["shards"])} shards')
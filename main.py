@@ -1,93 +1,242 @@
+# Started first, so that the time spent importing modules is part of the startup report
+from utils.profiling import StartupTimer, FrameTracer, draw_trace_overlay
+startup = StartupTimer()
+
 import pygame
-from utils.game import Player, Enemy
-from utils.models import GestureRecognizer
+from utils.simulation import GameSimulation, FixedTimestep, encode_action, save_input_trace
+from utils.models import GestureRecognizer, PredictionFilter
 from utils.datasets import load_configs
-from utils.images import process_frame
-import pandas as pd
-import pickle
-import cv2
+from utils.pipeline import GesturePipeline, InferenceScheduler
+from utils.images import FramePreprocessor
+from utils.sources import open_source
+from utils.levels import load_level
+from utils.tracking import HandROITracker, HandAssigner
+from utils.renderer import DirtyRectRenderer, TextCache, GlyphCache
+import argparse
+import os
+from time import perf_counter as clock_time
 
 
+parser = argparse.ArgumentParser()
+parser.add_argument(
+    '--source', default='0',
+    help='Camera index, video file, directory of frames or raw frame dump (.npy/.raw) to read frames from'
+)
+parser.add_argument(
+    '--frame_shape', type=int, nargs=3, default=None, metavar=('H', 'W', 'C'),
+    help='Shape of the frames of a headerless raw frame dump (.raw), e.g. 480 640 3'
+)
+parser.add_argument(
+    '--fast', action='store_true',
+    help='Read recorded sources as fast as possible instead of at their real-time frame rate'
+)
+parser.add_argument('--loop', action='store_true', help='Restart recorded sources when they end')
+parser.add_argument(
+    '--level', default='levels.csv',
+    help='Level to play, either a CSV or a level compiled with `compile_levels.py`'
+)
+parser.add_argument(
+    '--record_trace', default=None,
+    help='Where to save the per-tick input trace (.npy) for headless replays with `simulate.py`'
+)
+parser.add_argument(
+    '--filter', default='none', choices=['none', 'vote', 'ema'],
+    help='Temporal filter applied to predictions, trades a little latency for stable control (off by default)'
+)
+parser.add_argument(
+    '--latency_budget', type=float, default=0.15,
+    help='Delay (seconds) the prediction filter may add to a change of gesture'
+)
+parser.add_argument(
+    '--track_roi', action='store_true',
+    help='Only search the region around the previously detected hand, falling back to the full frame'
+)
+parser.add_argument(
+    '--config', default='configs/left_neutral_right.json',
+    help='Control scheme; gestures named after a direction (e.g. `left`, `thumb_up`) move the player that way'
+)
+parser.add_argument(
+    '--model_path', default=None,
+    help='Classifier to use (.npz or .pkl), defaults to the exported model of the control scheme'
+)
+parser.add_argument(
+    '--save_model', default=None,
+    help='Where to save the model (.npz) after live calibration; with an incremental model (see '
+         '`train_model.py --incremental`), pressing a key of the key map adds the current hand pose to its class'
+)
+parser.add_argument(
+    '--players', type=int, default=1, choices=[1, 2, 3, 4],
+    help='Number of players sharing the camera, each controlling a character with one hand'
+)
+parser.add_argument(
+    '--adaptive_rate', action='store_true',
+    help='Run inference less often while the hand is static or absent, at full rate when enemies are close'
+)
+parser.add_argument(
+    '--max_interval', type=float, default=0.2,
+    help='Longest time (seconds) between two inferences with `--adaptive_rate`'
+)
+parser.add_argument('--startup_report', action='store_true', help='Print how long each startup step took')
+parser.add_argument(
+    '--profile', action='store_true',
+    help='Time every stage of every frame and show the breakdown in an overlay (toggled with TAB)'
+)
+parser.add_argument(
+    '--trace_output', default=None,
+    help='Where to save the frame stage timings (Chrome trace JSON, e.g. for chrome://tracing or Perfetto)'
+)
+args = parser.parse_args()
+startup.mark('imports')
+
 # Game parameters
 window_size = [600, 1000]
-delay = 1
+fps = 60  # render rate, independent of camera and inference speed
+tick_rate = 60  # simulation rate, independent of render rate
 player_width, player_height = 50, 50
-player_acc = 0.2  # divided by fps -> doesn't actually work
+player_acc = 0.2  # per simulation tick
 player_color = [203, 96, 21]
+player_colors = [player_color, [21, 128, 203], [46, 160, 67], [150, 60, 180]]  # one per player
 gesture_control = True
 spawn_rate = 3000
+max_prediction_age = 0.5  # seconds before a prediction is considered stale
+danger_distance = 150  # enemies closer than this to a player make inference run at full rate
 
 # Initialize recognizer and capture
-class_map, key_map = load_configs('configs/left_neutral_right.json')
-with open('saved_models/left_neutral_right.pkl', 'rb') as f:
-    clf = pickle.load(f)
-recognizer = GestureRecognizer(saved_clf=clf)
-capture = cv2.VideoCapture(0)
+class_map, key_map = load_configs(args.config)
+# (left, right, up, down) of each gesture, from the direction its name ends with; other gestures are neutral
+directions = ['left', 'right', 'up', 'down']
+class_inputs = {
+    pred: tuple(name.split('_')[-1] == direction for direction in directions) for pred, name in class_map.items()
+}
+no_input = (False,) * 4
+# Players only move vertically under schemes that have up/down gestures (horizontal-only otherwise)
+vertical = any(name.split('_')[-1] in ('up', 'down') for name in class_map.values())
+# Prefer the exported (NumPy-only) model over the pickled sklearn one
+scheme = os.path.splitext(os.path.basename(args.config))[0]
+if args.model_path is not None:
+    if not os.path.exists(args.model_path):
+        parser.error(f'model `{args.model_path}` does not exist')
+    model_path = args.model_path
+else:
+    model_path = f'saved_models/{scheme}.npz'
+    if not os.path.exists(model_path):
+        model_path = f'saved_models/{scheme}.pkl'
+# Region-of-interest tracking follows a single hand, it is not used with several players
+roi_tracker = HandROITracker() if args.track_roi and args.players == 1 else None
+recognizer = GestureRecognizer.load(model_path, roi_tracker=roi_tracker, max_num_hands=args.players)
+startup.mark('classifier loaded')
+
+# The camera is opened and the hand tracking model is built and warmed up in the pipeline's threads,
+#   while the window opens and the first frames render
+tracer = FrameTracer() if args.profile or args.trace_output is not None else None
+prediction_filters = []
+if args.filter != 'none':
+    prediction_filters = [
+        PredictionFilter(recognizer.classes, mode=args.filter, latency_budget=args.latency_budget)
+        for _ in range(args.players)
+    ]
+# With several players, all hands are detected and classified together and assigned to players
+hand_assigner = HandAssigner(args.players) if args.players > 1 else None
+if hand_assigner is not None:
+    pipeline_filter = prediction_filters or None
+else:
+    pipeline_filter = prediction_filters[0] if prediction_filters else None
+scheduler = InferenceScheduler(max_interval=args.max_interval) if args.adaptive_rate else None
+pipeline = GesturePipeline(
+    lambda: open_source(args.source, realtime=not args.fast, loop=args.loop, frame_shape=args.frame_shape),
+    recognizer,
+    preprocess=FramePreprocessor(),
+    prediction_filter=pipeline_filter,
+    tracer=tracer,
+    hand_assigner=hand_assigner,
+    scheduler=scheduler
+)
+if gesture_control:
+    pipeline.start()
 
 # Initialize pygame
 pygame.init()
 window = pygame.display.set_mode(window_size)
 pygame.display.set_caption('Gesture-Controlled Game!')
 clock = pygame.time.Clock()
-pygame.time.set_timer(pygame.USEREVENT, spawn_rate)
+startup.mark('window opened')
 
 
-run, ret = True, True
+run = True
 draw_fps = False
-skip_frame = False  # used to increase the frame rate from 30 to 60
+draw_trace = args.profile
 
 fps_font = pygame.font.SysFont(None, 16)
 action_font = pygame.font.SysFont(None, 32)
 
-player = Player(
-    x=window_size[0] // 2 - player_width // 2,
-    y=window_size[1] // 2 - player_height // 2,
-    width=player_width, height=player_height,
-    ax=player_acc, window_size=window_size
-)
+# Only the parts of the window that changed are redrawn, text is rendered once and reused
+renderer = DirtyRectRenderer(window, background=(255, 255, 255))
+action_texts = [TextCache(action_font, color, (255, 255, 255)) for color in player_colors[:args.players]]
+for texts in action_texts:
+    for text in list(class_map.values()) + ['Neutral', 'Left', 'Right', 'Up', 'Down']:
+        texts.get(text)
+fps_glyphs = GlyphCache(fps_font, (255, 255, 255), (0, 0, 0))
 
-levels = pd.read_csv('levels.csv')
-levels = list(levels.to_numpy())
-enemies = []
+level = load_level(args.level, window_size, spawn_interval=spawn_rate)
+simulation = GameSimulation(
+    level,
+    window_size=window_size,
+    tick_rate=tick_rate,
+    player_size=(player_width, player_height),
+    player_acc=player_acc,
+    tracer=tracer,
+    num_players=args.players
+)
+timestep = FixedTimestep(tick_rate)
+actions = []  # input trace, one action per tick
+startup.mark('level loaded')
+first_frame, model_ready = True, not gesture_control
+calibration_samples = 0
 
-while run and ret:
-    pygame.time.delay(delay)
+while run:
+    if tracer is not None:
+        tracer.new_frame()
 
     if gesture_control:
-        # Retrieve and process webcam image
-        # This is where frame rate is capped
-        if not skip_frame:
-            ret, frame = capture.read()
-            frame = process_frame(frame)
-
-            # Model prediction and player action
-            pred = recognizer.predict_image(frame)
+        # Latest prediction from the background pipeline, never blocks on the camera
+        if not pipeline.running:
+            break
+        if not model_ready and pipeline.ready.is_set():
+            startup.mark('model ready')
+            model_ready = True
+        preds, timestamp = pipeline.latest()
+        if args.players == 1:
+            preds = [preds]
+        if timestamp is None or clock_time() - timestamp > max_prediction_age:
+            preds = [None] * args.players
+
+        # Players' actions
+        inputs, action_labels = [], []
+        for pred in preds:
             if pred is not None:
-                if pred == 0:
-                    left_pressed, right_pressed = True, False
-                elif pred == 2:
-                    left_pressed, right_pressed = False, True
-                else:
-                    left_pressed, right_pressed = False, False
-                action_text = class_map[pred]
+                inputs.append(class_inputs[pred])
+                action_labels.append(class_map[pred])
             else:
-                left_pressed = right_pressed = False
-                action_text = 'Neutral'
-        skip_frame = not skip_frame
+                inputs.append(no_input)
+                action_labels.append('Neutral')
     else:
         # Handle key presses
         keys = pygame.key.get_pressed()
-        left_pressed, right_pressed = False, False
+        pressed = (
+            keys[pygame.K_LEFT], keys[pygame.K_RIGHT], vertical and keys[pygame.K_UP], vertical and keys[pygame.K_DOWN]
+        )
+        held = [direction.capitalize() for direction, key in zip(directions, pressed) if key]
 
-        if keys[pygame.K_LEFT]:
-            left_pressed = True
-            action_text = 'Left'
-        if keys[pygame.K_RIGHT]:
-            right_pressed = True
-            action_text = 'Right'
+        action_text = held[0] if len(held) == 1 else 'Neutral'
+        inputs, action_labels = [pressed], [action_text]
 
-        if left_pressed and right_pressed:
-            action_text = 'Neutral'
+    # Inference runs at full rate while an enemy is within reach of a player
+    if scheduler is not None:
+        rects = [
+            (player.x, player.y, player.width, player.height)
+            for player, alive in zip(simulation.players, simulation.players_alive) if alive
+        ]
+        scheduler.set_danger(bool((simulation.enemies.distances(rects) < danger_distance).any()))
 
     # Handle events
     for event in pygame.event.get():
@@ -97,49 +246,104 @@ while run and ret:
         if event.type == pygame.KEYDOWN:
             if event.key == pygame.K_SPACE:
                 draw_fps = not draw_fps
-        if event.type == pygame.USEREVENT:
-            # Spawn new enemy
-            if len(levels) > 0:
-                row = list(levels.pop(0))
-                new_enemies = Enemy.create_enemies(row[1:], row[0], window_size)
-                enemies.extend(new_enemies)
+            elif event.key == pygame.K_TAB and tracer is not None:
+                draw_trace = not draw_trace
+                renderer.invalidate()
+            elif gesture_control and event.key in key_map:
+                # Live calibration: the current hand pose becomes a sample of the key's class
+                if args.players > 1:
+                    print('Calibration is only available with a single player')
+                elif not recognizer.incremental:
+                    print('Calibration requires an incremental model, see `train_model.py --incremental`')
+                elif recognizer.calibrate(key_map[event.key]):
+                    calibration_samples += 1
+                    print(f'Calibration sample added to {class_map[key_map[event.key]]}')
 
-    # Render game
-    window.fill((255, 255, 255))
-
-    # Update and render player
-    x, y = player.update_pos(clock, left_pressed, right_pressed)
-    pygame.draw.rect(window, player_color, (x, y, player.width, player_height))
-
-    # Update and render enemies; collision detection, delete if out of bond
-    enemies_length = len(enemies)
-    for i, enemy in enumerate(enemies[::-1]):
-        pos = enemy.update_pos()
-        if pos is None:
-            enemies.pop(enemies_length - i - 1)
-        else:
-            x, y = pos
-        pygame.draw.rect(window, enemy.color, (x, y, enemy.width, enemy.height))
-
-        # Collision detection
-        if enemy.rect.colliderect(player.rect):
+    # Advance the simulation by however many fixed ticks fit in the elapsed time
+    for _ in range(timestep.advance(clock.get_time() / 1000)):
+        encoded = [encode_action(*player_inputs) for player_inputs in inputs]
+        actions.append(encoded[0] if args.players == 1 else encoded)
+        if not simulation.step_players(inputs):
             print('COLLISION')
             run = False
+            break
+
+    # Render game
+    render_start = clock_time()
 
-    # Draw caption for action
-    action_image = action_font.render(action_text, True, player_color, (255, 255, 255))
-    _, action_height = action_font.size(action_text)
-    if action_image is not None:
-        window.blit(action_image, (20, window_size[1] - action_height - 20))
+    # Render players
+    for player, alive, color in zip(simulation.players, simulation.players_alive, player_colors):
+        if alive:
+            renderer.draw_rect(color, (player.x, player.y, player.width, player.height))
+
+    # Render enemies
+    for rect in simulation.enemies.rects():
+        renderer.draw_rect(simulation.enemies.color, rect)
+
+    # Draw caption for each player's action
+    for i, (texts, action_text) in enumerate(zip(action_texts, action_labels)):
+        action_image = texts.get(action_text)
+        x = 20 + i * window_size[0] // args.players
+        renderer.blit(action_image, (x, window_size[1] - action_image.get_height() - 20))
 
     # Draw FPS
     if draw_fps:
         text = 'FPS: ' + str(int(clock.get_fps()))
-        fps_image = fps_font.render(text, True, (255, 255, 255), (0, 0, 0))
-        window.blit(fps_image, (20, 20))
+        if gesture_control:
+            text += f' | capture: {int(pipeline.capture_fps)} | inference: {int(pipeline.inference_fps)}'
+            text += f' | dropped: {pipeline.frames_dropped}'
+        renderer.blit_glyphs(fps_glyphs.layout(text, (20, 20)))
 
-    pygame.display.update()
-    clock.tick()
+    # Draw per-stage frame timings, drawn directly on the window so the whole window is redrawn
+    if draw_trace:
+        renderer.invalidate()
+    renderer.render()
+    if draw_trace:
+        draw_trace_overlay(window, fps_font, tracer, 1000 / fps)
 
+    if tracer is not None:
+        flip_start = clock_time()
+        tracer.record('render', render_start, flip_start)
+        renderer.flip()
+        tracer.record('flip', flip_start, clock_time())
+    else:
+        renderer.flip()
+    clock.tick(fps)
+    if first_frame:
+        startup.mark('first frame')
+        first_frame = False
 
+
+pipeline.stop()
+if hasattr(pipeline.capture, 'release'):
+    pipeline.capture.release()
 pygame.quit()
+
+if args.startup_report:
+    print(startup.report())
+
+if args.save_model is not None and calibration_samples > 0:
+    recognizer.save(args.save_model)
+    print(f'Model with {calibration_samples} calibration samples saved at', args.save_model)
+
+if args.trace_output is not None:
+    tracer.save_chrome_trace(args.trace_output)
+    print('Frame trace saved at', args.trace_output)
+
+if args.record_trace is not None:
+    save_input_trace(actions, args.record_trace)
+    print('Input trace saved at', args.record_trace)
+
+if gesture_control:
+    print(f'Frames captured: {pipeline.capture_counter.count}, inferred: {pipeline.inference_counter.count}, '
+          f'dropped: {pipeline.frames_dropped}')
+    if scheduler is not None:
+        print(f'Adaptive inference: {scheduler.mean_interval * 1000:.0f} ms mean rest between frames')
+    if roi_tracker is not None:
+        print(f'ROI tracking: {roi_tracker.roi_hits} frames tracked, {roi_tracker.full_searches} full-frame searches, '
+              f'{roi_tracker.pixel_ratio:.0%} of pixels processed')
+    for i, prediction_filter in enumerate(prediction_filters):
+        metrics = prediction_filter.metrics
+        name = f'Player {i + 1} prediction' if args.players > 1 else 'Prediction'
+        print(f'{name} changes per second: {metrics.raw_flicker_rate:.2f} raw, '
+              f'{metrics.flicker_rate:.2f} filtered; added latency: {metrics.mean_latency * 1000:.0f} ms mean')
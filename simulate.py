@@ -0,0 +1,42 @@
+import argparse
+import time
+
+from utils.levels import load_level
+from utils.simulation import GameSimulation, load_input_trace
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--levels', default='levels.csv', help='Level to replay, CSV or compiled (see `compile_levels.py`)')
+parser.add_argument(
+    '--traces', nargs='*', default=[],
+    help='Recorded input traces (.npy, see `main.py --record_trace`); a run without input is always included'
+)
+parser.add_argument('--tick_rate', type=int, default=60, help='Simulation ticks per second')
+parser.add_argument('--max_ticks', type=int, default=None, help='Maximum number of ticks per run')
+parser.add_argument('--window_size', type=int, nargs=2, default=[600, 1000])
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+
+    # Replay the level headless with each controller
+    controllers = {'no input': None}
+    controllers.update({path: load_input_trace(path) for path in args.traces})
+
+    for name, actions in controllers.items():
+        level = load_level(args.levels, args.window_size)
+        # Traces of multiplayer sessions have one column per player
+        num_players = actions.shape[1] if actions is not None and actions.ndim == 2 else 1
+        simulation = GameSimulation(
+            level,
+            window_size=args.window_size,
+            tick_rate=args.tick_rate,
+            num_players=num_players
+        )
+        start = time.perf_counter()
+        result = simulation.run(actions, args.max_ticks)
+        elapsed = time.perf_counter() - start
+
+        outcome = 'survived' if result['survived'] else 'collided'
+        print(f'[{name}] {outcome} after {result["ticks"]} ticks ({result["time"]:.1f}s game time), '
+              f'{result["spawned"]} enemies spawned; {result["ticks"] / elapsed:.0f} ticks/s')
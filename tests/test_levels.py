@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+
+from utils.levels import (
+    HEADER, MAGIC, VERSION, SEGMENT_DTYPE, row_segments, compile_rows, write_level, read_level, LevelStream
+)
+
+
+WINDOW_SIZE = [600, 1000]
+# One row of each enemy type: down, up, right, left
+ROWS = [
+    [0, 1, 1, 0, 0, 1, 0, 0, 0, 1, 1],
+    [1, 0, 1, 1, 1, 0, 0, 1, 0, 0, 0],
+    [2, 1, 0, 0, 0, 0, 0, 0, 0, 0, 1],
+    [3, 0, 0, 1, 1, 1, 1, 0, 1, 1, 0]
+]
+
+
+def compile_level(path, rows=ROWS, spawn_interval=3000):
+    return write_level(compile_rows(rows, WINDOW_SIZE, spawn_interval), str(path), WINDOW_SIZE)
+
+
+def test_round_trip(tmp_path):
+    path = tmp_path / 'level.bin'
+    count = compile_level(path)
+
+    segments = np.concatenate(list(read_level(str(path), WINDOW_SIZE, chunk_size=2)))
+    expected = np.concatenate(list(compile_rows(ROWS, WINDOW_SIZE)))
+    assert count == len(segments) == sum(len(row_segments(row[1:], row[0], WINDOW_SIZE)) for row in ROWS)
+    assert segments.dtype == SEGMENT_DTYPE
+    assert np.array_equal(segments, expected)
+    assert set(segments['direction']) == {0, 1, 2, 3}
+
+
+def test_window_size_mismatch(tmp_path):
+    path = tmp_path / 'level.bin'
+    compile_level(path)
+    with pytest.raises(ValueError):
+        list(read_level(str(path), [800, 1000]))
+
+
+def test_extra_byte(tmp_path):
+    path = tmp_path / 'level.bin'
+    compile_level(path)
+    with open(path, 'ab') as f:
+        f.write(b'\0')
+    with pytest.raises(ValueError):
+        list(read_level(str(path)))
+
+
+def test_header_count_mismatch(tmp_path):
+    path = tmp_path / 'level.bin'
+    count = compile_level(path)
+    with open(path, 'r+b') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, WINDOW_SIZE[0], WINDOW_SIZE[1], 0, count + 1))
+    with pytest.raises(ValueError):
+        list(read_level(str(path)))
+
+
+def test_pop_due(tmp_path):
+    path = tmp_path / 'level.bin'
+    compile_level(path, spawn_interval=1000)
+    level = LevelStream(read_level(str(path), chunk_size=1))
+    expected = list(compile_rows(ROWS, WINDOW_SIZE, spawn_interval=1000))
+
+    assert len(level.pop_due(0)) == 0
+    for i, row in enumerate(expected):
+        # Nothing until the row's spawn time, then exactly its segments
+        assert len(level.pop_due((i + 1) * 1000 - 1)) == 0
+        assert not level.finished
+        assert np.array_equal(level.pop_due((i + 1) * 1000), row)
+    assert level.finished
+    assert level.spawned == sum(len(row) for row in expected)
+    assert len(level.pop_due(10 ** 6)) == 0
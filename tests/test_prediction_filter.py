@@ -0,0 +1,99 @@
+import numpy as np
+
+from utils.models import PredictionFilter
+
+
+def noisy_scores(classes, fps=30, noise=0.2, num_classes=3, seed=0):
+    """
+    One-hot decision scores of a gesture sequence, with a fraction `noise` of frames predicting a random other class
+    :param classes: (class, duration in seconds) of each gesture
+    :return: list of (timestamp, scores, true class)
+    """
+    rng = np.random.default_rng(seed)
+    frames, t = [], 0.
+    for class_, duration in classes:
+        for _ in range(int(duration * fps)):
+            pred = class_
+            if rng.random() < noise:
+                pred = (class_ + rng.integers(1, num_classes)) % num_classes
+            frames.append((t, np.eye(num_classes)[pred], class_))
+            t += 1 / fps
+    return frames
+
+
+def run(prediction_filter, frames):
+    return [prediction_filter.update(scores, t) for t, scores, _ in frames]
+
+
+def switches(outputs):
+    return sum(a != b for a, b in zip(outputs, outputs[1:]))
+
+
+def test_vote_removes_flicker():
+    frames = noisy_scores([(0, 2.), (2, 2.)])
+    prediction_filter = PredictionFilter([0, 1, 2], mode='vote', latency_budget=0.15)
+    outputs = run(prediction_filter, frames)
+
+    raw = [int(np.argmax(scores)) for _, scores, _ in frames]
+    assert switches(raw) > 20
+    # Only the real change of gesture gets through, within the latency budget
+    assert outputs[0] == 0 and outputs[-1] == 2
+    assert switches(outputs) == 1
+    assert prediction_filter.metrics.output_changes == 1
+    assert prediction_filter.metrics.raw_changes == switches(raw)
+    assert 0 < prediction_filter.metrics.mean_latency <= 0.15 + 1e-9
+
+
+def test_ema_removes_flicker():
+    # Decision scores of a real classifier are not one-hot: the true class leads by a noisy margin
+    rng = np.random.default_rng(0)
+    frames = [(i / 30, 0.5 * np.eye(3)[1 if i < 60 else 0] + rng.normal(0, 0.25, 3)) for i in range(120)]
+    prediction_filter = PredictionFilter([0, 1, 2], mode='ema', latency_budget=0.15)
+    outputs = [prediction_filter.update(scores, t) for t, scores in frames]
+
+    raw = [int(np.argmax(scores)) for _, scores in frames]
+    assert switches(raw) > 20
+    assert outputs[0] == 1 and outputs[-1] == 0
+    assert switches(outputs) == 1
+    assert prediction_filter.metrics.mean_latency <= 0.15
+
+
+def test_hysteresis():
+    prediction_filter = PredictionFilter(['a', 'b'], mode='ema', latency_budget=0.15, hysteresis=0.2)
+    assert prediction_filter.update([1., 0.], 0.) == 'a'
+    # Steady scores in which `b` leads by less than the hysteresis never switch the output
+    for i in range(1, 60):
+        assert prediction_filter.update([0.45, 0.55], i / 30) == 'a'
+    # A clear lead switches it right away, for good
+    outputs = [prediction_filter.update([0.2, 0.8], 2 + i / 30) for i in range(30)]
+    assert all(output == 'b' for output in outputs)
+
+
+def test_vote_hysteresis():
+    prediction_filter = PredictionFilter([0, 1], mode='vote', latency_budget=0.5, hysteresis=0.2)
+    # Alternating predictions give both classes about half of the votes, the first class is kept
+    outputs = [prediction_filter.update(np.eye(2)[i % 2], i / 30) for i in range(90)]
+    assert set(outputs) == {0}
+
+
+def test_short_dropout_is_ignored():
+    prediction_filter = PredictionFilter([0, 1], mode='ema', latency_budget=0.15)
+    for i in range(10):
+        prediction_filter.update([0., 1.], i / 30)
+    # Hand lost for less than the latency budget
+    assert prediction_filter.update(None, 10 / 30) == 1
+    assert prediction_filter.update(None, 12 / 30) == 1
+    # ... and for longer
+    assert prediction_filter.update(None, 1.) is None
+
+
+def test_class_added_during_calibration():
+    prediction_filter = PredictionFilter([0, 2], mode='ema', latency_budget=0.15)
+    for i in range(10):
+        assert prediction_filter.update([0., 1.], i / 30, classes=[0, 2]) == 2
+    # Class 1 is inserted between the existing ones, the current output keeps its label
+    assert prediction_filter.update([0., 0., 1.], 10 / 30, classes=[0, 1, 2]) == 2
+    outputs = [prediction_filter.update([0., 1., 0.], (11 + i) / 30, classes=[0, 1, 2]) for i in range(10)]
+    assert outputs[-1] == 1
+    # Scores computed before the class was added are skipped
+    assert prediction_filter.update([1., 0.], 1., classes=[0, 1, 2]) == 1
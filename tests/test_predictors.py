@@ -0,0 +1,96 @@
+import pickle
+import numpy as np
+import pytest
+from sklearn.svm import SVC
+from sklearn.linear_model import LogisticRegression
+
+from utils.predictors import SVCPredictor, LinearPredictor, KNNClassifier, load_classifier
+
+
+def blobs(num_classes, num_samples=40, num_features=6, seed=0):
+    # Overlapping gaussian clusters, so that the decision values near class boundaries are exercised
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(0, 2, (num_classes, num_features))
+    y = rng.integers(0, num_classes, num_samples * num_classes)
+    X = centers[y] + rng.normal(0, 1.5, (len(y), num_features))
+    return X, y
+
+
+@pytest.mark.parametrize('num_classes', [2, 4])
+def test_svc_matches_sklearn(num_classes):
+    X, y = blobs(num_classes)
+    clf = SVC(kernel='rbf', gamma='scale').fit(X, y)
+    predictor = SVCPredictor.from_sklearn(clf)
+
+    X_test, _ = blobs(num_classes, seed=1)
+    assert np.array_equal(predictor.predict(X_test), clf.predict(X_test))
+    assert np.allclose(predictor.decision_function(X_test), clf.decision_function(X_test), atol=1e-9)
+
+
+def test_svc_string_labels():
+    X, y = blobs(3)
+    labels = np.array(['left', 'neutral', 'right'])[y]
+    clf = SVC(kernel='rbf').fit(X, labels)
+    assert np.array_equal(SVCPredictor.from_sklearn(clf).predict(X), clf.predict(X))
+
+
+def test_svc_rejects_other_kernels():
+    X, y = blobs(2)
+    with pytest.raises(ValueError):
+        SVCPredictor.from_sklearn(SVC(kernel='linear').fit(X, y))
+
+
+@pytest.mark.parametrize('num_classes', [2, 4])
+def test_svc_save_load(tmp_path, num_classes):
+    X, y = blobs(num_classes)
+    predictor = SVCPredictor.from_sklearn(SVC(kernel='rbf').fit(X, y))
+    path = str(tmp_path / 'svc.npz')
+    predictor.save(path)
+
+    loaded = load_classifier(path)
+    assert isinstance(loaded, SVCPredictor)
+    assert np.array_equal(loaded.predict(X), predictor.predict(X))
+    assert np.array_equal(loaded.decision_function(X), predictor.decision_function(X))
+
+
+@pytest.mark.parametrize('num_classes', [2, 4])
+def test_linear_save_load(tmp_path, num_classes):
+    X, y = blobs(num_classes)
+    clf = LogisticRegression().fit(X, y)
+    predictor = LinearPredictor.from_sklearn(clf)
+    assert np.array_equal(predictor.predict(X), clf.predict(X))
+
+    path = str(tmp_path / 'linear.npz')
+    predictor.save(path)
+    loaded = load_classifier(path)
+    assert isinstance(loaded, LinearPredictor)
+    assert np.array_equal(loaded.predict(X), predictor.predict(X))
+    assert np.array_equal(loaded.decision_function(X), predictor.decision_function(X))
+
+
+def test_knn_save_load(tmp_path):
+    X, y = blobs(3)
+    clf = KNNClassifier(n_neighbors=3, max_samples_per_class=30).fit(X, y)
+    path = str(tmp_path / 'knn.npz')
+    clf.save(path)
+
+    loaded = load_classifier(path)
+    assert isinstance(loaded, KNNClassifier)
+    assert len(loaded) == len(clf)
+    assert (loaded.n_neighbors, loaded.max_samples_per_class) == (3, 30)
+    assert np.array_equal(loaded.predict(X), clf.predict(X))
+
+
+def test_knn_pickle(tmp_path):
+    X, y = blobs(3)
+    clf = KNNClassifier(n_neighbors=3).fit(X, y)
+    path = tmp_path / 'knn.pkl'
+    with open(path, 'wb') as f:
+        pickle.dump(clf, f)
+
+    # The lock is left out of the pickle and recreated when loading
+    loaded = load_classifier(str(path))
+    assert isinstance(loaded, KNNClassifier)
+    assert np.array_equal(loaded.decision_function(X), clf.decision_function(X))
+    loaded.partial_fit(X[:5], y[:5])
+    assert len(loaded) == len(clf) + 5
@@ -0,0 +1,68 @@
+import os
+import numpy as np
+import pygame
+
+from utils.renderer import DirtyRectRenderer
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+WINDOW_SIZE = (300, 500)
+BACKGROUND = (255, 255, 255)
+
+
+def scene(frame, labels):
+    """
+    Scripted scene: enemies crossing the window in every direction (partly off-screen), a moving player,
+        overlapping items, and labels that change every few frames
+    :return: list of ('rect', color, rect) and ('blit', surface, position)
+    """
+    items = []
+    for i in range(6):
+        t = (frame * (2 + i) + 40 * i) % 700 - 100
+        if i % 2:
+            items.append(('rect', (255, 90, 61), (i * 50 - 20, t, 120, 30)))
+        else:
+            items.append(('rect', (255, 90, 61), (t - 50, i * 80, 40, 100)))
+    items.append(('rect', (203, 96, 21), (150 + 100 * np.sin(frame / 20), 250 + 50 * np.cos(frame / 15), 50, 50)))
+    items.append(('rect', (21, 128, 203), (120, 200, 80, 80)))  # static, overlapped by moving items
+    items.append(('blit', labels[(frame // 7) % len(labels)], (20, 460)))
+    return items
+
+
+def draw_full(surface, items):
+    # `fill` misplaces rectangles that start off-screen, they are clipped first (as the renderer does)
+    surface.fill(BACKGROUND)
+    for kind, a, b in items:
+        if kind == 'rect':
+            surface.fill(a, pygame.Rect(b).clip(surface.get_rect()))
+        else:
+            surface.blit(a, b)
+
+
+def test_dirty_rects_match_full_redraw():
+    pygame.display.init()
+    try:
+        window = pygame.display.set_mode(WINDOW_SIZE)
+        reference = pygame.Surface(WINDOW_SIZE)
+        renderer = DirtyRectRenderer(window, background=BACKGROUND)
+
+        labels = []
+        for i, color in enumerate([(0, 0, 0), (200, 0, 0), (0, 120, 0)]):
+            label = pygame.Surface((60 + 20 * i, 20))
+            label.fill(color)
+            labels.append(label)
+
+        for frame in range(300):
+            items = scene(frame, labels)
+            for kind, a, b in items:
+                if kind == 'rect':
+                    renderer.draw_rect(a, b)
+                else:
+                    renderer.blit(a, b)
+            renderer.render()
+            renderer.flip()
+
+            draw_full(reference, items)
+            assert np.array_equal(pygame.surfarray.array3d(window), pygame.surfarray.array3d(reference)), frame
+    finally:
+        pygame.display.quit()
@@ -0,0 +1,87 @@
+import threading
+import time
+import pytest
+
+from utils.pipeline import InferenceScheduler
+
+
+@pytest.fixture
+def scheduler(monkeypatch):
+    scheduler = InferenceScheduler(max_interval=0.2, stable_time=0.5, max_duty=0.5, min_headroom=0.2)
+    # CPU load is set by the tests instead of being measured
+    monkeypatch.setattr(scheduler, '_update_load', lambda: None)
+    return scheduler
+
+
+def test_stable_ramp(scheduler):
+    intervals = {t: scheduler.interval(1, t, 0.01) for t in [0., 0.25, 0.5, 0.75, 1., 2.]}
+    # Full rate until the prediction has been stable for `stable_time`, then a linear ramp up to `max_interval`
+    assert intervals[0.] == intervals[0.25] == intervals[0.5] == 0.
+    assert intervals[0.75] == pytest.approx(0.1)
+    assert intervals[1.] == intervals[2.] == pytest.approx(0.2)
+
+    # A new prediction starts over
+    assert scheduler.interval(2, 2.1, 0.01) == 0.
+
+
+def test_no_hand(scheduler):
+    assert scheduler.interval(None, 0., 0.01) == pytest.approx(0.2)
+    # Multiplayer: only when no player's hand is visible
+    assert scheduler.interval((None, None), 0.1, 0.01) == pytest.approx(0.2)
+    assert scheduler.interval((None, 1), 0.2, 0.01) == 0.
+
+
+def test_danger(scheduler):
+    scheduler.interval(1, 0., 0.01)
+    scheduler.set_danger(True)
+    assert scheduler.interval(1, 5., 0.01) == 0.
+    assert scheduler.interval(None, 6., 0.01) == 0.
+    scheduler.cpu_load = 1.
+    assert scheduler.interval(1, 7., 0.01) == 0.
+
+    scheduler.set_danger(False)
+    assert scheduler.interval(1, 8., 0.01) == pytest.approx(0.2)
+
+
+def test_cpu_limited(scheduler):
+    scheduler.cpu_load = 0.9
+    # Inference may only run `max_duty` of the time: a 50 ms inference is followed by a 50 ms rest
+    assert scheduler.interval(1, 0., 0.05) == pytest.approx(0.05)
+    # Longer rests of a stable prediction are kept
+    assert scheduler.interval(1, 2., 0.05) == pytest.approx(0.2)
+
+    scheduler.cpu_load = 0.5
+    assert scheduler.interval(2, 3., 0.05) == 0.
+
+
+def test_static_hand_skips_frames(scheduler):
+    # 4 seconds of a static hand at 30 FPS, inference taking 10 ms
+    t, inferred, frame_time = 0., 0, 1 / 30
+    while t < 4.:
+        inferred += 1
+        rest = scheduler.interval(1, t, 0.01)
+        # The next frame processed is the first one captured after the rest
+        t += 0.01 + rest
+        t = (int(t / frame_time) + 1) * frame_time
+    assert inferred < 0.5 * 4 * 30
+    assert scheduler.mean_interval > 0.
+
+
+def test_set_danger_cuts_wait_short(scheduler):
+    stop = threading.Event()
+    timer = threading.Timer(0.05, scheduler.set_danger, [True])
+    timer.start()
+    start = time.perf_counter()
+    scheduler.wait(5., stop)
+    assert time.perf_counter() - start < 1.
+    timer.join()
+
+
+def test_stop_cuts_wait_short(scheduler):
+    stop = threading.Event()
+    timer = threading.Timer(0.05, stop.set)
+    timer.start()
+    start = time.perf_counter()
+    scheduler.wait(5., stop)
+    assert time.perf_counter() - start < 1.
+    timer.join()
@@ -1,6 +1,8 @@
-from utils.models import GestureRecognizer
-from utils.datasets import load_dataset, split_dataset, load_configs
-import pickle
+from utils.models import GestureRecognizer, FeatureTransform
+from utils.datasets import iter_dataset, load_dataset, split_dataset, load_configs
+from utils.predictors import KNNClassifier, export_classifier
+from utils.selection import model_search, select_model, save_report, print_report
+import numpy as np
 import argparse
 
 
@@ -14,56 +16,218 @@ parser.add_argument(
     help='Configuration file to use for training'
 )
 parser.add_argument('--model_save_dir', default=None, help='Where to save the trained model')
+parser.add_argument(
+    '--export_dir', default=None,
+    help='Where to export the trained model as plain arrays (.npz) for sklearn-free inference'
+)
 parser.add_argument('--separate_test_dataset', default=None)
 parser.add_argument('--predict_video_stream', action='store_true')
+parser.add_argument('--video_source', default='0', help='Frame source used by `--predict_video_stream`')
+parser.add_argument(
+    '--num_workers', type=int, default=1,
+    help='Number of processes used for landmark extraction'
+)
+parser.add_argument(
+    '--cache_dir', default='.landmark_cache',
+    help='Where extracted landmarks are cached, only new or modified images are processed'
+)
+parser.add_argument('--no_cache', action='store_true', help='Always extract landmarks from every image')
+parser.add_argument(
+    '--incremental', action='store_true',
+    help='Train a k-NN classifier that can later absorb new samples (e.g. live calibration) without retraining'
+)
+parser.add_argument(
+    '--chunk_size', type=int, default=1024,
+    help='Number of samples incremental models are fit on at a time, memory use does not grow with the dataset'
+)
+parser.add_argument(
+    '--base_model', default=None,
+    help='Incremental model (.npz or .pkl) to add the dataset to, instead of training from scratch'
+)
+parser.add_argument(
+    '--normalize', action='store_true',
+    help='Make landmarks relative to the wrist and to the size of the hand before classification'
+)
+parser.add_argument(
+    '--joint_angles', action='store_true', help='Add the bending angle of every finger joint to the features'
+)
+parser.add_argument(
+    '--pca_components', type=int, default=None,
+    help='Number of principal components the features are reduced to, no reduction by default'
+)
+parser.add_argument(
+    '--pca_samples', type=int, default=10000,
+    help='Number of randomly sampled training landmarks PCA is fit on for incremental models'
+)
+parser.add_argument(
+    '--model_search', action='store_true',
+    help='Cross-validate several classifier families and hyperparameters instead of training a single SVC'
+)
+parser.add_argument('--folds', type=int, default=5, help='Number of cross-validation folds of `--model_search`')
+parser.add_argument(
+    '--search_iter', type=int, default=None,
+    help='Number of randomly sampled candidates of `--model_search`, all of them are tried by default'
+)
+parser.add_argument(
+    '--accuracy_target', type=float, default=0.95,
+    help='Cross-validation accuracy the selected model must reach, the fastest such model is selected'
+)
+parser.add_argument('--search_report', default=None, help='Where to save the model search report (.json or .csv)')
+parser.add_argument(
+    '--search_workers', type=int, default=None,
+    help='Number of processes used by `--model_search`, defaults to the number of cores'
+)
 
 
 if __name__ == '__main__':
     args = parser.parse_args()
     # Check if `model_save_dir` is in correct format (if specified)
     assert args.model_save_dir.endswith('.pkl') if args.model_save_dir is not None else True
+    assert args.export_dir.endswith('.npz') if args.export_dir is not None else True
 
     # Load configs for control scheme
     class_map, key_map = load_configs(args.config_dir)
+    # Feature transform, saved with the model
+    transform = None
+    if args.normalize or args.joint_angles or args.pca_components is not None:
+        transform = FeatureTransform(
+            translate=args.normalize,
+            scale=args.normalize,
+            angles=args.joint_angles,
+            pca_components=args.pca_components
+        )
+
     # Load model
-    recognizer = GestureRecognizer(class_map)
+    if args.base_model is not None:
+        # The base model keeps the feature transform it was trained with
+        recognizer = GestureRecognizer.load(args.base_model, class_map)
+        assert recognizer.incremental, 'Base model does not support incremental training'
+    elif args.incremental:
+        recognizer = GestureRecognizer(class_map, saved_clf=KNNClassifier(), transform=transform)
+    else:
+        recognizer = GestureRecognizer(class_map, transform=transform)
+
+    cache_dir = None if args.no_cache else args.cache_dir
 
-    # Load dataset, including predicting landmarks using mediapipe
-    images, landmarks, labels = load_dataset(args.dataset_dir, recognizer)
-    # Split dataset
-    datasets = split_dataset(
-        landmarks,
-        labels,
-        splits=[0.8, 0.2],
-        verbose=1
-    )
+    if recognizer.incremental and not args.model_search:
+        # Out-of-core training: landmarks are extracted and fit one chunk at a time, 20% of every chunk is
+        #   held out for testing
+        def dataset_chunks():
+            # Chunks come in the same order on every pass, and so does the train/test split drawn for them
+            split_rng = np.random.default_rng(split_seed)
+            for _, landmarks, labels in iter_dataset(
+                args.dataset_dir,
+                recognizer,
+                num_workers=args.num_workers,
+                cache_dir=cache_dir,
+                chunk_size=args.chunk_size
+            ):
+                yield landmarks, labels, split_rng.random(len(labels)) >= 0.8
 
-    # Fit and evaluate model
-    print('\nTraining model...', end=' ')
-    recognizer.clf.fit(*datasets[0])
-    print('Complete\nTest accuracy:', recognizer.clf.score(*datasets[-1]))
+        split_seed = int(np.random.randint(2 ** 31))
+        transform = recognizer.transform
+        if args.base_model is None and transform is not None and transform.pca_components is not None:
+            # Chunks are sorted by class, so PCA is fit in a first pass on a uniform sample of the training
+            #   landmarks of the whole dataset (the landmark cache makes the second pass cheap)
+            print('\nSampling training landmarks for PCA...')
+            sample, keys = np.zeros((0, recognizer.vec_dim), dtype='float32'), np.zeros(0)
+            for landmarks, labels, is_test in dataset_chunks():
+                # Keep the rows with the largest random keys, a sample without replacement
+                sample = np.concatenate([sample, landmarks[~is_test]])
+                keys = np.concatenate([keys, np.random.random(len(sample) - len(keys))])
+                kept = np.argsort(keys)[-args.pca_samples:]
+                sample, keys = sample[kept], keys[kept]
+            if len(sample) > 0:
+                transform.fit(sample)
+
+        print('\nTraining model on chunks of the dataset...')
+        test_landmarks, test_labels = [], []
+        for landmarks, labels, is_test in dataset_chunks():
+            recognizer.partial_fit(landmarks[~is_test], labels[~is_test])
+            test_landmarks.append(landmarks[is_test])
+            test_labels.append(labels[is_test])
+        if test_labels:
+            test_dataset = [np.concatenate(test_landmarks), np.concatenate(test_labels)]
+        else:
+            # No hand was detected in any image
+            test_dataset = [np.zeros((0, recognizer.vec_dim), dtype='float32'), np.zeros(0, dtype='int64')]
+        print(f'Trained on {len(recognizer.clf)} samples, tested on {len(test_dataset[1])}')
+        if len(test_dataset[1]) > 0:
+            print('Test accuracy:', recognizer.score(*test_dataset))
+    else:
+        # Load dataset, including predicting landmarks using mediapipe; images are not kept
+        _, landmarks, labels = load_dataset(
+            args.dataset_dir,
+            recognizer,
+            num_workers=args.num_workers,
+            cache_dir=cache_dir
+        )
+        # Split dataset
+        train_dataset, test_dataset = split_dataset(
+            landmarks,
+            labels,
+            splits=[0.8, 0.2],
+            verbose=1
+        )
+
+        # Fit and evaluate model
+        if args.model_search:
+            # Search on the training split only, the test split stays unseen until the final evaluation
+            print('\nSearching models...')
+            if recognizer.transform is not None:
+                recognizer.transform.fit(train_dataset[0])
+            results, predictors = model_search(
+                recognizer.features(train_dataset[0]),
+                train_dataset[1],
+                k=args.folds,
+                n_iter=args.search_iter,
+                num_workers=args.search_workers
+            )
+            selected = select_model(results, args.accuracy_target)
+            print_report(results, selected)
+            if args.search_report is not None:
+                save_report(results, args.search_report, selected)
+                print('Search report saved at', args.search_report)
+            recognizer.clf = predictors[selected]
+            print('Selected model:', results[selected]['family'], results[selected]['params'])
+        else:
+            print('\nTraining model...', end=' ')
+            recognizer.fit(*train_dataset)
+            print('Complete')
+        print('Test accuracy:', recognizer.score(*test_dataset))
 
     # Save trained model
     if args.model_save_dir is not None:
-        with open(args.model_save_dir, 'wb') as f:
-            pickle.dump(recognizer.clf, f)
+        recognizer.save(args.model_save_dir)
         print('Model saved at', args.model_save_dir)
     else:
         print('No `model_save_dir` specified, model is not saved')
 
+    # Export model for inference without sklearn
+    if args.export_dir is not None:
+        predictor = export_classifier(recognizer.clf)
+        X_test = recognizer.features(test_dataset[0])
+        if len(X_test) > 0:
+            assert (predictor.predict(X_test) == recognizer.clf.predict(X_test)).all(), \
+                'Exported model predictions differ from the trained model'
+        recognizer.save(args.export_dir)
+        print('Model exported at', args.export_dir)
+
     # Load and split dataset from a new domain (unseen room)
     if args.separate_test_dataset is not None:
-        images_test, landmarks_test, labels_test = load_dataset(
+        _, landmarks_test, labels_test = load_dataset(
             args.separate_test_dataset,
             recognizer,
-            train=False
+            train=False,
+            num_workers=args.num_workers,
+            cache_dir=cache_dir
         )
         dataset_test = split_dataset(
             landmarks_test,
             labels_test,
             splits=[1.0]
         )[0]
-        print('Test (new domain) accuracy:', recognizer.clf.score(*dataset_test))
+        print('Test (new domain) accuracy:', recognizer.score(*dataset_test))
 
     # Predict from video stream
     if args.predict_video_stream:
@@ -71,5 +235,6 @@ if __name__ == '__main__':
             continuous=True,
             plot_image=False,
             delay=1,
-            show_capture=False
+            show_capture=False,
+            source=args.video_source
         )
@@ -0,0 +1,97 @@
+import os
+import json
+import hashlib
+import numpy as np
+
+
+class FeatureCache:
+    """
+    On-disk store of landmark vectors produced by `GestureRecognizer.image2vec`
+    Vectors are kept in a single memory-mapped .npy file, a JSON index maps each image to its row
+    Images are keyed by path (plus offset for images in packed shards), size and modification time;
+        a separate store is used for each set of MediaPipe settings, so changing them never returns stale landmarks
+    Images in which no hand was detected are stored as rows of NaN
+    """
+    def __init__(self, cache_dir, settings, dim=63):
+        """
+        :param cache_dir: directory in which the cache files are stored
+        :param settings: dict of settings that influence the landmarks (MediaPipe version, model options...)
+        :param dim: dimension of the landmark vectors
+        """
+        self.dim = dim
+        settings_key = hashlib.sha1(json.dumps(settings, sort_keys=True).encode()).hexdigest()[:12]
+        os.makedirs(cache_dir, exist_ok=True)
+        self.features_path = os.path.join(cache_dir, f'landmarks_{settings_key}.npy')
+        self.index_path = os.path.join(cache_dir, f'landmarks_{settings_key}.json')
+
+        # Index: path -> [row, size, mtime]
+        self.index = {}
+        self.features = np.zeros((0, dim), dtype='float32')
+        if os.path.exists(self.index_path) and os.path.exists(self.features_path):
+            with open(self.index_path, 'r') as f:
+                self.index = json.load(f)['index']
+            self.features = np.load(self.features_path, mmap_mode='r')
+
+        # Vectors added since loading, written out by `save`
+        self._new_rows = []
+        self.hits, self.misses = 0, 0
+
+    @staticmethod
+    def _file_key(path, offset=None):
+        stat = os.stat(path)
+        key = os.path.abspath(path) if offset is None else f'{os.path.abspath(path)}[{offset}]'
+        return key, stat.st_size, stat.st_mtime_ns
+
+    def get(self, path, offset=None):
+        """
+        Look up the landmarks of an image
+        :param path: path of the image file, or of the shard holding the image
+        :param offset: index of the image in its shard, None for image files
+        :return: (found, vector); vector is None when no hand was detected in the image
+        """
+        key, size, mtime = self._file_key(path, offset)
+        entry = self.index.get(key)
+        if entry is None or entry[1:] != [size, mtime]:
+            self.misses += 1
+            return False, None
+
+        self.hits += 1
+        row = entry[0]
+        if row < len(self.features):
+            vec = np.array(self.features[row])
+        else:
+            vec = self._new_rows[row - len(self.features)]
+        return True, (None if np.isnan(vec[0]) else vec)
+
+    def put(self, path, vec, offset=None):
+        key, size, mtime = self._file_key(path, offset)
+        row = np.full(self.dim, np.nan, dtype='float32') if vec is None else np.asarray(vec, dtype='float32')
+        self.index[key] = [len(self.features) + len(self._new_rows), size, mtime]
+        self._new_rows.append(row)
+
+    def save(self):
+        """
+        Write new vectors to disk, dropping rows that are no longer referenced by the index
+        """
+        if not self._new_rows:
+            return
+
+        features = np.concatenate([self.features, np.stack(self._new_rows)]) if len(self.features) \
+            else np.stack(self._new_rows)
+        keys = list(self.index.keys())
+        rows = np.array([self.index[key][0] for key in keys], dtype='int64')
+        features = features[rows]
+        for i, key in enumerate(keys):
+            self.index[key][0] = i
+
+        # Write to temporary files first so that an interrupted save never corrupts the cache
+        tmp_features, tmp_index = self.features_path + '.tmp.npy', self.index_path + '.tmp'
+        np.save(tmp_features, features)
+        with open(tmp_index, 'w') as f:
+            json.dump({'dim': self.dim, 'index': self.index}, f)
+        self.features = None  # release memory map before replacing the file
+        os.replace(tmp_features, self.features_path)
+        os.replace(tmp_index, self.index_path)
+
+        self.features = np.load(self.features_path, mmap_mode='r')
+        self._new_rows = []
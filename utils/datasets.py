@@ -2,8 +2,13 @@ import os
 import cv2
 import numpy as np
 from tqdm import tqdm
-from collections import defaultdict
+from collections import defaultdict, deque
 import json
+from multiprocessing import Pool
+
+from utils.cache import FeatureCache
+from utils.images import FramePreprocessor
+from utils.packing import PackedDataset, is_packed, open_shard
 
 
 def load_configs(config_dir):
@@ -21,38 +26,165 @@ def load_configs(config_dir):
     return class_map, key_map
 
 
+# Stored images are already cropped, resized and flipped; same preprocessing path as live frames
+_preprocessors = {}
+
+
 def process_image(image, cvt_color=True, target_size=(224, 224, 3)):
     if image.shape != target_size:
         raise NotImplementedError
-    if cvt_color:
-        image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-    return image
+    key = (target_size, cvt_color)
+    if key not in _preprocessors:
+        _preprocessors[key] = FramePreprocessor(target_size[1::-1], flip=False, cvt_color=cvt_color)
+    return _preprocessors[key](image, out=np.empty(target_size, dtype='uint8'))
 
 
-def load_dataset(dataset_dir, recognizer, train=True):
-    images, landmarks, labels = [], [], []
+def list_dataset(dataset_dir):
+    """
+    List the images of a dataset, stored either as one sub-directory of image files per class,
+        or packed into shards (see utils.packing)
+    Both layouts use the class index of the class map as label: packed shards store it, and class
+        sub-directories are named after it (as written by `generate_data.py`)
+    Classes and files are sorted so that labels and sample order are deterministic
+    :param dataset_dir: root directory of the dataset
+    :return: list of (path, offset, label), number of classes;
+        offset is the index of the image in its shard, None for image files
+    """
+    if is_packed(dataset_dir):
+        samples = PackedDataset(dataset_dir).samples()
+        return samples, len({label for _, _, label in samples})
+
+    classes = [name for name in os.listdir(dataset_dir) if os.path.isdir(os.path.join(dataset_dir, name))]
+    invalid = [name for name in classes if not name.isdigit()]
+    if invalid:
+        raise ValueError(f'Class directories must be named after their class index, got {sorted(invalid)}')
+    # Sorted numerically, "10" comes after "2"
+    classes = sorted(classes, key=int)
+    files = []
+    for class_ in classes:
+        class_dir = os.path.join(dataset_dir, class_)
+        files.extend((os.path.join(class_dir, name), None, int(class_)) for name in sorted(os.listdir(class_dir)))
+    return files, len(classes)
+
+
+def read_image(path, offset=None):
+    # RGB image from an image file or from a packed shard (already RGB)
+    if offset is None:
+        return process_image(cv2.imread(path))
+    return np.array(open_shard(path)[offset])
+
+
+def _extract_sample(path, offset, recognizer, train, keep_image=True):
+    # Load and process image, the image itself is only returned when asked for
+    image = read_image(path, offset)
+    lms = recognizer.image2vec(image, train)
+    return (image if keep_image else None), lms
+
+
+# Each worker process builds its own recognizer (and MediaPipe graphs) once
+_worker_recognizer = None
+
+
+def _init_worker():
+    global _worker_recognizer
+    from utils.models import GestureRecognizer
+    _worker_recognizer = GestureRecognizer()
+
+
+def _extract_sample_worker(args):
+    path, offset, train, keep_image = args
+    return _extract_sample(path, offset, _worker_recognizer, train, keep_image)
+
+
+def iter_dataset(dataset_dir, recognizer, train=True, num_workers=1, cache_dir=None, chunk_size=1024,
+                 keep_images=False):
+    """
+    Extract hand landmarks from every image of a dataset, yielding the samples in chunks
+    Only the current chunk is held in memory, and images are dropped once their landmarks are known
+        unless `keep_images` is set, so memory use does not grow with the size of the dataset
+    Samples in which no hand is detected are skipped
+    :param dataset_dir: root directory of the dataset, one sub-directory per class or a packed dataset
+    :param recognizer: GestureRecognizer used for landmark extraction in the main process
+    :param train: whether to use the static image (train) or video stream (test) hands model
+    :param num_workers: number of worker processes; each builds its own MediaPipe model
+    :param cache_dir: directory of the landmark cache, only new or modified images are processed when specified
+    :param chunk_size: number of samples per chunk
+    :param keep_images: whether to also yield the images
+    :return: generator of (images, landmarks, labels) chunks; images is None unless `keep_images` is set
+    """
     undetected_count = defaultdict(lambda: 0)
     class_count = defaultdict(lambda: 0)
 
-    # Test recognizer, trigger TensorFlow Lite message
-    recognizer.image2vec(np.zeros((224, 224, 3), dtype='uint8'))
-
-    print(f'Processing images from {len(os.listdir(dataset_dir))} classes:')
-    for i, class_ in enumerate(os.listdir(dataset_dir)):
-        for image_name in tqdm(os.listdir(os.path.join(dataset_dir, class_)), ncols=80):
-            # Load and process image
-            image = cv2.imread(os.path.join(dataset_dir, class_, image_name))
-            image = process_image(image)
-            lms = recognizer.image2vec(image, train)
-
-            if lms is not None:
-                class_count[i] += 1
-                images.append(image)
-                landmarks.append(lms)
-                labels.append(i)
+    files, num_classes = list_dataset(dataset_dir)
+
+    # Look up landmarks of unchanged images
+    cache, cached = None, {}
+    if cache_dir is not None:
+        cache = FeatureCache(cache_dir, recognizer.landmark_settings(train))
+        for path, offset, _ in files:
+            found, lms = cache.get(path, offset)
+            if found:
+                cached[path, offset] = lms
+        print(f'Found landmarks of {len(cached)} images in cache')
+    to_process = [(path, offset) for path, offset, _ in files if (path, offset) not in cached]
+    print(f'Processing {len(to_process)} images from {num_classes} classes:')
+
+    pool = None
+    if num_workers > 1 and len(to_process) > 0:
+        # Workers process shards of the file list, `imap` returns results in file order
+        pool_chunk_size = max(1, min(len(to_process) // (num_workers * 4), chunk_size))
+        pool = Pool(num_workers, initializer=_init_worker)
+        tasks = [(path, offset, train, keep_images) for path, offset in to_process]
+        processed = _imap_bounded(pool, tasks, chunk_size, pool_chunk_size)
+    else:
+        if to_process:
+            # Test recognizer, trigger TensorFlow Lite message
+            recognizer.warmup(train)
+        processed = (
+            _extract_sample(path, offset, recognizer, train, keep_images) for path, offset in to_process
+        )
+    progress = tqdm(processed, total=len(to_process), ncols=80)
+    processed = iter(progress)
+
+    # Merge cached and newly processed samples, keeping the file order
+    images, landmarks, labels = [], [], []
+    completed = False
+    try:
+        for path, offset, label in files:
+            if (path, offset) in cached:
+                # Landmarks are already known, the image is only read if asked for
+                lms = cached[path, offset]
+                image = read_image(path, offset) if keep_images and lms is not None else None
             else:
-                undetected_count[i] += 1
-                # print(os.path.join(class_, image_name), '- hand not detected')
+                image, lms = next(processed)
+                if cache is not None:
+                    cache.put(path, lms, offset)
+
+            if lms is None:
+                undetected_count[label] += 1
+                continue
+            class_count[label] += 1
+            images.append(image)
+            landmarks.append(lms)
+            labels.append(label)
+
+            if len(labels) == chunk_size:
+                yield _make_chunk(images, landmarks, labels, keep_images)
+                images, landmarks, labels = [], [], []
+        if labels:
+            yield _make_chunk(images, landmarks, labels, keep_images)
+        completed = True
+    finally:
+        progress.close()
+        if pool is not None:
+            # Stop the workers right away if the caller stopped early
+            if completed:
+                pool.close()
+            else:
+                pool.terminate()
+            pool.join()
+        if cache is not None:
+            cache.save()
 
     # Print messages
     if undetected_count:
@@ -61,7 +193,50 @@ def load_dataset(dataset_dir, recognizer, train=True):
         print('All hands are detected')
     print('Class count:', dict(class_count))
 
-    return [np.asarray(x) for x in [images, landmarks, labels]]
+
+def _imap_bounded(pool, tasks, batch_size, pool_chunk_size):
+    # `imap` over batches of tasks, submitting the next batch only once the previous one is being consumed:
+    #   at most two batches of results (which may hold images) wait in memory, however slow the consumer is
+    batches = [tasks[start:start + batch_size] for start in range(0, len(tasks), batch_size)]
+    pending = deque()
+    for batch in batches:
+        pending.append(pool.imap(_extract_sample_worker, batch, chunksize=pool_chunk_size))
+        if len(pending) > 1:
+            yield from pending.popleft()
+    while pending:
+        yield from pending.popleft()
+
+
+def _make_chunk(images, landmarks, labels, keep_images):
+    return (
+        np.stack(images) if keep_images else None,
+        np.stack(landmarks).astype('float32', copy=False),
+        np.asarray(labels, dtype='int64')
+    )
+
+
+def load_dataset(dataset_dir, recognizer, train=True, num_workers=1, cache_dir=None, keep_images=False):
+    """
+    Load a dataset and extract hand landmarks from every image, see `iter_dataset`
+    :param keep_images: whether to return the images too, which takes far more memory than the landmarks
+    :return: images (None unless `keep_images` is set), landmarks, labels
+    """
+    chunks = list(iter_dataset(
+        dataset_dir,
+        recognizer,
+        train=train,
+        num_workers=num_workers,
+        cache_dir=cache_dir,
+        keep_images=keep_images
+    ))
+    if not chunks:
+        images = np.zeros((0, 224, 224, 3), dtype='uint8') if keep_images else None
+        return images, np.zeros((0, recognizer.vec_dim), dtype='float32'), np.zeros(0, dtype='int64')
+
+    images = np.concatenate([chunk[0] for chunk in chunks]) if keep_images else None
+    landmarks = np.concatenate([chunk[1] for chunk in chunks])
+    labels = np.concatenate([chunk[2] for chunk in chunks])
+    return images, landmarks, labels
 
 
 def split_dataset(X, y, splits=(0.8, 0, 0.2), verbose=0):
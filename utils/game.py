@@ -1,113 +1,154 @@
 import pygame
+import numpy as np
 
 
 class Player:
     """
-    The player character with basic, acceleration-based movement
-    Slows down exponentially when no action is present
+    The player character with basic, acceleration-based movement in four directions
+    Slows down exponentially along an axis when no action is present on it
     """
-    def __init__(self, x, y, width, height, ax, window_size):
+    def __init__(self, x, y, width, height, ax, window_size, ay=None):
         self.x, self.y = x, y
         self.width, self.height = width, height
         self.rect = pygame.Rect(x, y, width, height)
 
-        # This character can only move along the horizontal axis
-        self.ax = ax  # acceleration
-        self.vx = 0  # velocity
+        self.ax = ax  # horizontal acceleration
+        self.ay = ax if ay is None else ay  # vertical acceleration
+        self.vx, self.vy = 0, 0  # velocity
 
         # Used for boundary detection
         self.window = window_size
 
-    def update_pos(self, clock, left, right):
-        # TO-DO: frame independent movement
-
-        acc = 0
-        if left:
-            acc -= self.ax
-        elif right:
-            acc += self.ax
+    @staticmethod
+    def _axis(pos, vel, acc, negative, positive, length, size):
+        # Movement along one axis: accelerate, or slow down without action, then stay inside the window
+        if negative:
+            vel -= acc
+        elif positive:
+            vel += acc
         else:
-            self.vx *= 0.9
-
-        self.vx += acc
-        self.x += self.vx
+            vel *= 0.9
+        pos += vel
 
         # Boundary detection - make player bounce off wall?
-        if self.x <= 0:
-            self.x = 0
-            self.vx = 0
-        if self.x + self.width >= self.window[0]:
-            self.x = self.window[0] - self.width
-            self.vx = 0
-
-        if self.vx < -6:
-            self.vx = -6
-        if self.vx > 6:
-            self.vx = 6
+        if pos <= 0:
+            pos, vel = 0, 0
+        if pos + size >= length:
+            pos, vel = length - size, 0
+        return pos, min(max(vel, -6), 6)
+
+    def update_pos(self, left, right, up=False, down=False):
+        # Advances one fixed simulation tick (see utils.simulation), so all constants are per tick
+        self.x, self.vx = self._axis(self.x, self.vx, self.ax, left, right, self.window[0], self.width)
+        self.y, self.vy = self._axis(self.y, self.vy, self.ay, up, down, self.window[1], self.height)
 
         self.rect.update(self.x, self.y, self.width, self.height)
         return self.x, self.y
 
 
-class Enemy:
+class EnemyField:
     """
-    Horizontal bars that move from one side of the screen to another
-    (Theoretically the game would have enemies coming from all directions,
-        and the player would have four-directional movement)
+    All enemies stored as a struct of arrays (positions, velocities, sizes)
+    Enemies are moved, culled and checked for collisions in bulk with NumPy instead of one object at a time
     """
-    def __init__(self, x, y, width, height, window_size, dx=0, dy=1, color=[255, 90, 61]):
-        self.x, self.y = x, y
-        self.dx, self.dy = dx, dy
-        self.width, self.height = width, height
-        self.rect = pygame.Rect(x, y, width, height)
-
-        self.color=color
+    def __init__(self, window_size, capacity=64, color=[255, 90, 61], margin=100):
+        """
+        :param window_size: size of the playing field
+        :param capacity: initial number of enemies that fit in the arrays (at least 1), grown as needed
+        :param color: color shared by all enemies
+        :param margin: enemies are destroyed once they are this far outside of the window
+        """
         self.window_size = window_size
-
-    def update_pos(self):
-        self.x += self.dx
-        self.y += self.dy
+        self.color = color
+        self.margin = margin
+
+        if capacity < 1:
+            raise ValueError(f'`capacity` must be at least 1, got {capacity}')
+        self.pos = np.zeros((capacity, 2))  # top-left corners
+        self.vel = np.zeros((capacity, 2))
+        self.size = np.zeros((capacity, 2))  # widths and heights
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def _reserve(self, n):
+        capacity = len(self.pos)
+        if self.count + n <= capacity:
+            return
+        while capacity < self.count + n:
+            capacity *= 2
+        for name in ['pos', 'vel', 'size']:
+            array = np.zeros((capacity, 2))
+            array[:self.count] = getattr(self, name)[:self.count]
+            setattr(self, name, array)
+
+    def add(self, segments):
+        """
+        :param segments: sequence of (x, y, width, height, dx, dy)
+        """
+        if len(segments) == 0:
+            return
+        segments = np.asarray(segments, dtype='float64').reshape(-1, 6)
+        self._reserve(len(segments))
+        new = slice(self.count, self.count + len(segments))
+        self.pos[new] = segments[:, 0:2]
+        self.size[new] = segments[:, 2:4]
+        self.vel[new] = segments[:, 4:6]
+        self.count += len(segments)
+
+    def step(self):
+        """
+        Move every enemy by its velocity and destroy those that left the playing field
+        """
+        n = self.count
+        pos = self.pos[:n]
+        pos += self.vel[:n]
 
         # Boundary detection, destroy on impact
-        if self.x > self.window_size[0] + 100 or self.x < -100:
-            return None
-        if self.y > self.window_size[1] + 100 or self.y < -100:
-            return None
-
-        self.rect.update(self.x, self.y, self.width, self.height)
-        return self.x, self.y
-
-    @staticmethod
-    def create_enemies(row, type, window_size, speed=3):
-        # Types are not fully implemented
-        types = {
-            0: [0, 1, 0, -50],
-            1: [0, -1, 0, window_size[1] + 50],
-            2: [1, 0, -50, 0],
-            3: [-1, 0, -50, window_size[0] + 50]
-        }
-
-        # Instantiate enemies given a `row` (array)
-        row_length = len(row)
-        block_width = window_size[0] // row_length
-        row.append(0)
-        enemies = []
-
-        w, h = 0, 50
-        x, y = types[type][2:]
-        prev = 0
-
-        for i in row:
-            if i == 1:
-                w += block_width
-            elif i == 0 and prev == 1:
-                # Ending an enemy instance
-                dx, dy = types[type][:2]
-                enemies.append(Enemy(x, y, w, h, window_size, dx * speed, dy * speed))
-                x += w + block_width
-                w = 0
-            else:
-                x += block_width
-            prev = i
-
-        return enemies
+        inside = (
+            (pos[:, 0] <= self.window_size[0] + self.margin) & (pos[:, 0] >= -self.margin) &
+            (pos[:, 1] <= self.window_size[1] + self.margin) & (pos[:, 1] >= -self.margin)
+        )
+        if not inside.all():
+            kept = np.flatnonzero(inside)
+            for array in [self.pos, self.vel, self.size]:
+                array[:len(kept)] = array[kept]
+            self.count = len(kept)
+
+    def collisions(self, rects):
+        """
+        Collision test of several rectangles (e.g. every player) in a single pass over the enemies
+        :param rects: (k, 4) array of (x, y, width, height)
+        :return: boolean array, whether each rectangle overlaps any enemy
+        """
+        rects = np.asarray(rects, dtype='float64').reshape(-1, 4)
+        n = self.count
+        if n == 0:
+            return np.zeros(len(rects), dtype=bool)
+        pos, size = self.pos[:n], self.size[:n]
+        x, y, width, height = (rects[:, i:i + 1] for i in range(4))
+        return (
+            (pos[:, 0] < x + width) & (x < pos[:, 0] + size[:, 0]) &
+            (pos[:, 1] < y + height) & (y < pos[:, 1] + size[:, 1])
+        ).any(axis=1)
+
+    def rects(self):
+        # (x, y, width, height) of every enemy, used for rendering
+        return np.concatenate([self.pos[:self.count], self.size[:self.count]], axis=1)
+
+    def distances(self, rects):
+        """
+        Smallest gap between each of several rectangles and any enemy, in a single pass over the enemies
+        :param rects: (k, 4) array of (x, y, width, height)
+        :return: array of distances in pixels, inf when there are no enemies
+        """
+        rects = np.asarray(rects, dtype='float64').reshape(-1, 4)
+        n = self.count
+        if n == 0:
+            return np.full(len(rects), np.inf)
+        pos, size = self.pos[:n], self.size[:n]
+        x, y, width, height = (rects[:, i:i + 1] for i in range(4))
+        gap_x = np.maximum(0, np.maximum(pos[:, 0] - (x + width), x - (pos[:, 0] + size[:, 0])))
+        gap_y = np.maximum(0, np.maximum(pos[:, 1] - (y + height), y - (pos[:, 1] + size[:, 1])))
+        return np.sqrt(gap_x ** 2 + gap_y ** 2).min(axis=1)
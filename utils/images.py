@@ -1,4 +1,111 @@
 import cv2
+import numpy as np
+
+
+def crop_geometry(h, w, target_size=(224, 224), avoid_distortion=True):
+    """
+    Region of a frame kept by the center crop
+    :return: x, y, crop width, crop height
+    """
+    if not avoid_distortion:
+        return 0, 0, w, h
+
+    # Keeps the shorter dimension constant
+    shape = (h, w)
+    short_dim = 0 if h <= w else 1
+    target_ratio = target_size[1 - short_dim] / target_size[short_dim]
+    cur_ratio = shape[1 - short_dim] / shape[short_dim]
+    ratio = target_ratio / cur_ratio
+
+    crop_size = [0, 0]
+    crop_size[short_dim] = shape[short_dim]
+    crop_size[1 - short_dim] = int(shape[1 - short_dim] * ratio)
+    crop_h, crop_w = crop_size
+    if crop_h > h or crop_w > w:
+        raise ValueError('Target shape and frame dimensions are incompatible for no distortion')
+
+    # Center crop
+    center = (h // 2, w // 2)
+    x, y = center[1] - crop_w // 2, center[0] - crop_h // 2
+    return x, y, crop_w, crop_h
+
+
+class FramePreprocessor:
+    """
+    Center crop, resize, horizontal flip and BGR -> RGB conversion of frames
+    The crop geometry and remapping tables are computed once per input resolution; each frame is then
+        cropped, resized and flipped in a single `cv2.remap` pass into a reused output buffer, and the
+        channels are swapped in place
+    Used for both live frames and training images, so that both go through exactly the same operations
+    """
+    def __init__(self, target_size=(224, 224), avoid_distortion=True, flip=True, cvt_color=True):
+        """
+        :param target_size: tuple, target size (width, height) of output frame
+        :param avoid_distortion: whether or not to avoid distortion by cropping
+        :param flip: whether to flip frames horizontally (mirror the camera)
+        :param cvt_color: whether to convert from BGR to RGB
+        """
+        self.target_size = tuple(target_size)
+        self.avoid_distortion = avoid_distortion
+        self.flip = flip
+        self.cvt_color = cvt_color
+
+        self._shape = None
+        self._maps = None  # None when the geometry is the identity
+        self._buffer = np.empty((self.target_size[1], self.target_size[0], 3), dtype='uint8')
+
+    def _prepare(self, shape):
+        h, w = shape[:2]
+        # Up-scaling is probably not a good idea
+        assert self.target_size[0] <= h
+        assert self.target_size[1] <= w
+
+        x, y, crop_w, crop_h = crop_geometry(h, w, self.target_size, self.avoid_distortion)
+        self._shape = shape
+        if (crop_w, crop_h) == self.target_size and not self.flip:
+            self._maps = None
+            self._crop = (x, y, crop_w, crop_h)
+            return
+
+        # Source coordinates of every output pixel, with the same pixel-center convention as cv2.resize
+        out_w, out_h = self.target_size
+        src_x = x + (np.arange(out_w) + 0.5) * crop_w / out_w - 0.5
+        src_y = y + (np.arange(out_h) + 0.5) * crop_h / out_h - 0.5
+        if self.flip:
+            # The crop is taken from the flipped frame
+            src_x = (w - 1) - src_x
+        map_x = np.tile(src_x.astype('float32'), (out_h, 1))
+        map_y = np.tile(src_y.astype('float32')[:, None], (1, out_w))
+        self._maps = cv2.convertMaps(map_x, map_y, cv2.CV_16SC2)
+
+    def __call__(self, frame, out=None):
+        """
+        :param frame: BGR frame
+        :param out: optional uint8 array to write the result into, the internal buffer is reused otherwise
+            (and overwritten by the next call)
+        :return: processed frame
+        """
+        if frame.shape != self._shape:
+            self._prepare(frame.shape)
+        out = self._buffer if out is None else out
+
+        if self._maps is None:
+            x, y, crop_w, crop_h = self._crop
+            src = frame[y: y + crop_h, x: x + crop_w]
+            if self.cvt_color:
+                cv2.cvtColor(src, cv2.COLOR_BGR2RGB, dst=out)
+            else:
+                out[:] = src
+            return out
+
+        cv2.remap(frame, *self._maps, cv2.INTER_LINEAR, dst=out, borderMode=cv2.BORDER_REPLICATE)
+        if self.cvt_color:
+            cv2.cvtColor(out, cv2.COLOR_BGR2RGB, dst=out)
+        return out
+
+
+# One preprocessor per configuration, so that geometry is only computed once per camera resolution
+_preprocessors = {}
 
 
 def process_frame(frame, target_size=(224, 224), avoid_distortion=True):
@@ -9,40 +116,11 @@ def process_frame(frame, target_size=(224, 224), avoid_distortion=True):
     :param avoid_distortion: whether or not to avoid distortion by cropping
     :return: 2-D array, processed frame'
     """
-    h, w, c = frame.shape
-
-    # Up-scaling is probably not a good idea
-    assert target_size[0] <= h
-    assert target_size[1] <= w
-
-    # Flip image horizontally and rearrange channels
-    frame = frame[:, ::-1, ::-1]
-
-    # Crop to avoid distortions
-    if avoid_distortion:
-        # Keeps the shorter dimension constant
-        short_dim = 0 if h <= w else 1
-        target_ratio = target_size[1 - short_dim] / target_size[short_dim]
-        cur_ratio = frame.shape[1 - short_dim] / frame.shape[short_dim]
-        ratio = target_ratio / cur_ratio
-
-        crop_size = [0, 0]
-        crop_size[short_dim] = frame.shape[short_dim]
-        crop_size[1 - short_dim] = int(frame.shape[1 - short_dim] * ratio)
-        crop_h, crop_w = crop_size
-
-        # Perform center crop
-        center = (h // 2, w // 2)
-        x, y = center[1] - crop_w // 2, center[0] - crop_h // 2
-        try:
-            frame = frame[y: y + crop_h, x: x + crop_w, :]
-        except Exception:
-            raise ValueError('Target shape and frame dimensions are incompatible for no distortion')
-
-    # Resize frame
-    frame = cv2.resize(frame, target_size)
-
-    return frame
+    key = (tuple(target_size), avoid_distortion)
+    if key not in _preprocessors:
+        _preprocessors[key] = FramePreprocessor(target_size, avoid_distortion)
+    preprocessor = _preprocessors[key]
+    return preprocessor(frame, out=np.empty_like(preprocessor._buffer))
 
 
 if __name__ == '__main__':
@@ -0,0 +1,228 @@
+import csv
+import os
+import struct
+import numpy as np
+
+
+# Binary level format: a fixed header followed by one record per enemy (spawn segment), sorted by spawn time
+MAGIC = b'GCLV'
+VERSION = 1
+HEADER = struct.Struct('<4sHHHHI')  # magic, version, window width, window height, padding, segment count
+UNKNOWN_COUNT = 0xFFFFFFFF
+SEGMENT_DTYPE = np.dtype([
+    ('time', '<u4'),  # spawn time in milliseconds
+    ('direction', 'u1'),  # enemy type, see `row_segments`
+    ('x', '<f4'), ('y', '<f4'),
+    ('width', '<f4'), ('height', '<f4'),
+    ('dx', '<f4'), ('dy', '<f4')
+])
+GEOMETRY_FIELDS = ['x', 'y', 'width', 'height', 'dx', 'dy']
+
+
+def read_level_csv(path):
+    """
+    Read the rows of a level CSV (header, then one `type, block_0, block_1, ...` row per line)
+    :return: generator of rows as lists of ints
+    """
+    with open(path, 'r', newline='') as f:
+        reader = csv.reader(f)
+        next(reader)
+        for row in reader:
+            if row:
+                yield [int(value) for value in row]
+
+
+def random_level_rows(num_blocks=10, num_rows=None, seed=None, directions=(0, 1)):
+    """
+    Procedurally generated level: random rows of blocks, each leaving at least one gap
+    :param num_blocks: number of blocks per row
+    :param num_rows: number of rows, endless if None
+    :param seed: random seed
+    :param directions: enemy types the rows are drawn from (see `row_segments`)
+    :return: generator of rows
+    """
+    rng = np.random.default_rng(seed)
+    i = 0
+    while num_rows is None or i < num_rows:
+        blocks = rng.integers(0, 2, num_blocks)
+        blocks[rng.integers(num_blocks)] = 0
+        yield [directions[int(rng.integers(len(directions)))]] + blocks.tolist()
+        i += 1
+
+
+def row_segments(row, type, window_size, speed=3):
+    """
+    Geometry of the enemies described by a `row` of a level (its blocks, without the type)
+    Enemies are bars that move from one side of the screen to another: horizontal bars move down (type 0) or up
+        (type 1), vertical bars move right (type 2) or left (type 3)
+    :return: list of (x, y, width, height, dx, dy)
+    """
+    # Direction (dx, dy) and starting position (x, y) of each type; blocks are laid out across the
+    #   direction of movement
+    types = {
+        0: [0, 1, 0, -50],
+        1: [0, -1, 0, window_size[1] + 50],
+        2: [1, 0, -50, 0],
+        3: [-1, 0, window_size[0] + 50, 0]
+    }
+
+    # Instantiate enemies given a `row` (array)
+    row_length = len(row)
+    dx, dy = types[type][:2]
+    vertical = dx != 0  # vertical bars, laid out along y
+    block_size = window_size[1 if vertical else 0] // row_length
+    segments = []
+
+    length, thickness = 0, 50
+    x, y = types[type][2:]
+    offset = 0
+    prev = 0
+
+    # A trailing empty block closes the last enemy
+    for i in list(row) + [0]:
+        if i == 1:
+            length += block_size
+        elif i == 0 and prev == 1:
+            # Ending an enemy instance
+            if vertical:
+                segments.append((x, y + offset, thickness, length, dx * speed, dy * speed))
+            else:
+                segments.append((x + offset, y, length, thickness, dx * speed, dy * speed))
+            offset += length + block_size
+            length = 0
+        else:
+            offset += block_size
+        prev = i
+
+    return segments
+
+
+def compile_rows(rows, window_size, spawn_interval=3000, speed=3):
+    """
+    Turn level rows into spawn segments; row `i` spawns at `(i + 1) * spawn_interval`
+    :param rows: iterable of level rows
+    :param window_size: size of the playing field, enemy geometry depends on it
+    :param spawn_interval: time between two rows, in milliseconds
+    :param speed: enemy speed, in pixels per tick
+    :return: generator of structured arrays (SEGMENT_DTYPE), one per row
+    """
+    for i, row in enumerate(rows):
+        segments = row_segments(row[1:], row[0], window_size, speed)
+        chunk = np.zeros(len(segments), dtype=SEGMENT_DTYPE)
+        chunk['time'] = (i + 1) * spawn_interval
+        chunk['direction'] = row[0]
+        geometry = np.asarray(segments, dtype='float32').reshape(-1, 6)
+        for k, name in enumerate(GEOMETRY_FIELDS):
+            chunk[name] = geometry[:, k]
+        yield chunk
+
+
+def write_level(chunks, path, window_size):
+    """
+    Write spawn segments to a binary level file, chunk by chunk (works with endless generators cut short)
+    :return: number of segments written
+    """
+    count = 0
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, window_size[0], window_size[1], 0, UNKNOWN_COUNT))
+        for chunk in chunks:
+            f.write(np.ascontiguousarray(chunk, dtype=SEGMENT_DTYPE).tobytes())
+            count += len(chunk)
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, VERSION, window_size[0], window_size[1], 0, count))
+    return count
+
+
+def read_level(path, window_size=None, chunk_size=256):
+    """
+    Stream the segments of a binary level file without loading it entirely
+    :param path: compiled level file
+    :param window_size: size of the playing field, checked against the one the level was compiled for
+    :param chunk_size: number of segments read at once
+    :return: generator of structured arrays (SEGMENT_DTYPE)
+    """
+    with open(path, 'rb') as f:
+        header = f.read(HEADER.size)
+        if len(header) < HEADER.size:
+            raise ValueError(f'`{path}` is not a compiled level (file too short for a header)')
+        magic, version, width, height, _, count = HEADER.unpack(header)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f'`{path}` is not a compiled level (version {VERSION})')
+        if window_size is not None and [width, height] != list(window_size):
+            raise ValueError(f'`{path}` was compiled for window size {[width, height]}, got {list(window_size)}')
+
+        # The count is unknown if writing was interrupted, the records must still be whole
+        size = os.fstat(f.fileno()).st_size - HEADER.size
+        if size % SEGMENT_DTYPE.itemsize != 0:
+            raise ValueError(
+                f'`{path}` is truncated or corrupt: {size} bytes of records is not a multiple of the '
+                f'record size ({SEGMENT_DTYPE.itemsize} bytes)'
+            )
+        if count != UNKNOWN_COUNT and count != size // SEGMENT_DTYPE.itemsize:
+            raise ValueError(
+                f'`{path}` is truncated or corrupt: header lists {count} segments, '
+                f'file holds {size // SEGMENT_DTYPE.itemsize}'
+            )
+
+        while True:
+            data = f.read(chunk_size * SEGMENT_DTYPE.itemsize)
+            if not data:
+                break
+            yield np.frombuffer(data, dtype=SEGMENT_DTYPE)
+
+
+class LevelStream:
+    """
+    Hands out spawn segments as their spawn time comes, pulling chunks from a (possibly endless) generator
+    """
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._buffer = np.zeros(0, dtype=SEGMENT_DTYPE)
+        self._empty = self._buffer
+        self._next_time = -1  # spawn time of the first buffered segment, checked before touching any array
+        self.exhausted = False
+        self.spawned = 0  # number of segments handed out
+
+    def _fill(self, time):
+        # Read until the buffer holds a segment spawning after `time`, or the level ends
+        while not self.exhausted and (len(self._buffer) == 0 or self._buffer['time'][-1] <= time):
+            try:
+                chunk = next(self._chunks)
+            except StopIteration:
+                self.exhausted = True
+                break
+            self._buffer = np.concatenate([self._buffer, chunk])
+
+    def pop_due(self, time):
+        """
+        :param time: current game time, in milliseconds
+        :return: structured array of the segments that spawn at or before `time`
+        """
+        if time < self._next_time:
+            return self._empty
+
+        self._fill(time)
+        n = np.searchsorted(self._buffer['time'], time, side='right')
+        due, self._buffer = self._buffer[:n], self._buffer[n:]
+        self._next_time = int(self._buffer['time'][0]) if len(self._buffer) else -1
+        self.spawned += n
+        return due
+
+    @property
+    def finished(self):
+        return self.exhausted and len(self._buffer) == 0
+
+
+def segment_geometry(segments):
+    # (n, 6) array of (x, y, width, height, dx, dy), as taken by `EnemyField.add`
+    return np.stack([segments[name] for name in GEOMETRY_FIELDS], axis=1)
+
+
+def load_level(path, window_size, spawn_interval=3000, speed=3):
+    """
+    Open a level for streaming: compiled levels are read chunk by chunk, CSV levels are compiled on the fly
+    :return: LevelStream
+    """
+    if path.endswith('.csv'):
+        return LevelStream(compile_rows(read_level_csv(path), window_size, spawn_interval, speed))
+    return LevelStream(read_level(path, window_size))
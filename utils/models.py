@@ -1,27 +1,216 @@
-import mediapipe as mp
-from sklearn.svm import SVC
-from sklearn.exceptions import NotFittedError
-import matplotlib.pyplot as plt
+import numpy as np
 import cv2
+import pickle
+from collections import deque
+from time import perf_counter
 
+from utils.predictors import load_classifier, export_classifier
+from utils.sources import open_source
 
-class GestureRecognizer:
-    def __init__(self, class_map=None, saved_clf=None):
-        # Initialize hand tracking models
-        mp_hands = mp.solutions.hands
-        self.hands = mp_hands.Hands(
-            static_image_mode=True,
-            max_num_hands=1
-        )
-        # During test, assume input to be video stream
-        self.hands_test = mp_hands.Hands(
-            static_image_mode=False,
-            max_num_hands=1
+
+# mediapipe, sklearn and matplotlib are slow to import, they are only imported once actually needed
+def _import_mediapipe():
+    import mediapipe as mp
+    return mp
+
+
+# Landmark indices of each finger, from the wrist to the fingertip
+FINGERS = [
+    [0, 1, 2, 3, 4],
+    [0, 5, 6, 7, 8],
+    [0, 9, 10, 11, 12],
+    [0, 13, 14, 15, 16],
+    [0, 17, 18, 19, 20]
+]
+
+
+class FeatureTransform:
+    """
+    Turns raw landmark vectors (image coordinates) into features that describe the hand's pose only
+    - translate: coordinates relative to the wrist, so features don't depend on where the hand is in the frame
+    - scale: coordinates divided by the wrist to middle finger base distance, so they don't depend on the
+        hand's distance to the camera
+    - angles: bending angle of every finger joint, invariant to position, scale and in-plane rotation
+    - PCA: projection on the main directions of variation of the training features, down to a few dimensions
+    Applied the same way during training and live inference, and saved along with the classifier
+    """
+    prefix = 'transform_'  # prefix of the transform's arrays in saved models
+
+    def __init__(self, translate=True, scale=True, angles=False, pca_components=None):
+        self.translate = translate
+        self.scale = scale
+        self.angles = angles
+        self.pca_components = pca_components
+
+        # Fitted PCA
+        self.mean = None
+        self.components = None
+
+    def _features(self, X):
+        X = np.asarray(X, dtype='float32')
+        points = X.reshape(len(X), -1, 3)
+        if self.translate:
+            points = points - points[:, :1]
+        if self.scale:
+            # Wrist (0) to middle finger base (9)
+            size = np.linalg.norm(points[:, 9] - points[:, 0], axis=1)
+            points = points / np.maximum(size, 1e-6)[:, None, None]
+        features = [points.reshape(len(X), -1)]
+
+        if self.angles:
+            joints = np.array([finger[i:i + 3] for finger in FINGERS for i in range(len(finger) - 2)])
+            a, b, c = points[:, joints[:, 0]], points[:, joints[:, 1]], points[:, joints[:, 2]]
+            u, v = a - b, c - b
+            cos = np.einsum('nij,nij->ni', u, v) / np.maximum(
+                np.linalg.norm(u, axis=2) * np.linalg.norm(v, axis=2), 1e-6
+            )
+            features.append(np.arccos(np.clip(cos, -1, 1)))
+        return np.concatenate(features, axis=1) if len(features) > 1 else features[0]
+
+    def fit(self, X):
+        # Only PCA needs fitting, the other steps are fixed
+        if self.pca_components is not None:
+            features = self._features(X)
+            self.mean = features.mean(axis=0)
+            _, _, vt = np.linalg.svd(features - self.mean, full_matrices=False)
+            self.components = vt[:self.pca_components].astype('float32')
+        return self
+
+    def transform(self, X):
+        """
+        :param X: (N, 63) landmark vectors
+        :return: (N, number of features) float32 array
+        """
+        features = self._features(X)
+        if self.components is not None:
+            features = (features - self.mean) @ self.components.T
+        return features
+
+    def fit_transform(self, X):
+        return self.fit(X).transform(X)
+
+    def save_into(self, path):
+        # Add the transform's arrays to a saved (.npz) model
+        with np.load(path) as data:
+            arrays = dict(data)
+        arrays[self.prefix + 'options'] = np.array(
+            [self.translate, self.scale, self.angles, -1 if self.pca_components is None else self.pca_components]
         )
+        if self.components is not None:
+            arrays[self.prefix + 'mean'] = self.mean
+            arrays[self.prefix + 'components'] = self.components
+        np.savez(path, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        # Transform saved with a (.npz) model, None if the model was trained on raw landmarks
+        with np.load(path) as data:
+            if cls.prefix + 'options' not in data:
+                return None
+            translate, scale, angles, pca_components = data[cls.prefix + 'options'].tolist()
+            transform = cls(bool(translate), bool(scale), bool(angles), None if pca_components < 0 else pca_components)
+            if cls.prefix + 'components' in data:
+                transform.mean = data[cls.prefix + 'mean']
+                transform.components = data[cls.prefix + 'components']
+        return transform
+
+
+class GestureRecognizer:
+    num_landmarks = 21
+    vec_dim = 63  # (x, y, z) of each landmark
+
+    def __init__(self, class_map=None, saved_clf=None, roi_tracker=None, max_num_hands=1, transform=None):
+        # Hand tracking models are built on first use, so that only the one actually needed is built
+        # Several hands are found in a single pass of the model, e.g. for multiplayer sessions
+        self.hands_config = {'max_num_hands': max_num_hands}
+        self._hands = None
+        self._hands_test = None
 
         # Initialize classifier of choice -> SVC
-        self.clf = saved_clf if saved_clf is not None else SVC(gamma=2, C=1)
+        # gamma=2 suits raw coordinates (within [0, 1]), transformed features are scaled by sklearn's heuristic
+        if saved_clf is None:
+            from sklearn.svm import SVC
+            saved_clf = SVC(gamma=2, C=1) if transform is None else SVC(gamma='scale', C=1)
+        self.clf = saved_clf
         self.class_map = class_map
+        # Optional FeatureTransform applied to landmark vectors before the classifier
+        self.transform = transform
+        # Optional HandROITracker, restricts landmark extraction of live frames to the region around the hand
+        self.roi_tracker = roi_tracker
+
+        # Reused across calls to `predict_image` to avoid allocating on every frame
+        self._vec_buffer = np.empty((1, self.vec_dim), dtype='float32')
+        self._multi_buffer = np.empty((max_num_hands, self.vec_dim), dtype='float32')
+        # Copy of the landmarks of the last live frame with a detected hand, used for live calibration
+        self.last_vec = None
+
+    @classmethod
+    def load(cls, model_path, class_map=None, **kwargs):
+        # Load a saved classifier and its feature transform, either exported arrays (.npz) or a pickled model (.pkl)
+        if model_path.endswith('.npz'):
+            clf, transform = load_classifier(model_path), FeatureTransform.load(model_path)
+        else:
+            with open(model_path, 'rb') as f:
+                clf, transform = pickle.load(f), None
+            if isinstance(clf, dict):
+                clf, transform = clf['clf'], clf['transform']
+        return cls(class_map, saved_clf=clf, transform=transform, **kwargs)
+
+    def save(self, model_path):
+        """
+        Save the classifier with its feature transform
+        :param model_path: .npz to export the classifier as plain arrays (see `export_classifier`),
+            .pkl to pickle it as is
+        """
+        if model_path.endswith('.npz'):
+            export_classifier(self.clf).save(model_path)
+            if self.transform is not None:
+                self.transform.save_into(model_path)
+        else:
+            with open(model_path, 'wb') as f:
+                # Models without transform are pickled alone, as they always were
+                pickle.dump(self.clf if self.transform is None else {'clf': self.clf, 'transform': self.transform}, f)
+
+    def features(self, landmarks):
+        # Classifier input of (N, 63) landmark vectors
+        return landmarks if self.transform is None else self.transform.transform(landmarks)
+
+    def fit(self, landmarks, labels):
+        # Fit the feature transform, then the classifier on the transformed landmarks
+        if self.transform is not None:
+            self.transform.fit(landmarks)
+        self.clf.fit(self.features(landmarks), labels)
+        return self
+
+    def score(self, landmarks, labels):
+        return np.mean(self.clf.predict(self.features(landmarks)) == np.asarray(labels))
+
+    def _build_hands(self, static_image_mode):
+        mp = _import_mediapipe()
+        return mp.solutions.hands.Hands(static_image_mode=static_image_mode, **self.hands_config)
+
+    @property
+    def hands(self):
+        # Hand tracking model for static images, used during training
+        if self._hands is None:
+            self._hands = self._build_hands(static_image_mode=True)
+        return self._hands
+
+    @property
+    def hands_test(self):
+        # During test, assume input to be video stream
+        if self._hands_test is None:
+            self._hands_test = self._build_hands(static_image_mode=False)
+        return self._hands_test
+
+    def warmup(self, train=True):
+        # Build the hand tracking model and run it once, the first inference is much slower than the others
+        self.image2vec(np.zeros((224, 224, 3), dtype='uint8'), train=train)
+
+    def landmark_settings(self, train=True):
+        # Everything that influences the landmarks produced by `image2vec`, used to key cached landmarks
+        mp = _import_mediapipe()
+        return dict(self.hands_config, static_image_mode=train, mediapipe=mp.__version__)
 
     def predict_landmarks(self, image, train=True):
         # Process an image using mediapipe to produce 63-d vector, image must be RGB
@@ -36,36 +225,153 @@ class GestureRecognizer:
             return None
         return results[0]
 
-    def image2vec(self, image, train=True):
-        # Process an image using mediapipe to produce 63-d vector, image must be RGB
+    def predict_all_landmarks(self, image, train=True):
+        # Landmarks of every detected hand (up to `max_num_hands`), empty list if no hand is detected
+        hands = self.hands if train else self.hands_test
+        return hands.process(image).multi_hand_landmarks or []
+
+    @staticmethod
+    def _fill_vec(landmarks, out):
+        i = 0
+        for lm in landmarks.landmark:
+            out[i] = lm.x
+            out[i + 1] = lm.y
+            out[i + 2] = lm.z
+            i += 3
+        return out
+
+    def image2vec(self, image, train=True, out=None):
+        """
+        Process an image using mediapipe to produce 63-d vector, image must be RGB
+        :param image: RGB image
+        :param train: whether to use the static image (train) or video stream (test) hands model
+        :param out: optional float32 array with 63 elements to write the vector into, allocated if not given
+        :return: 1-D float32 array, None if no hand is detected
+        """
         landmarks = self.predict_landmarks(image, train=train)
         if landmarks is None:
             return None
 
-        # Create vector by concatenating coordinates of each landmark
-        vec = []
-        for lm in landmarks.landmark:
-            coords = [lm.x, lm.y, lm.z]
-            vec.extend(coords)
+        # Fill the vector in place with the coordinates of each landmark
+        if out is None:
+            out = np.empty(self.vec_dim, dtype='float32')
+        return self._fill_vec(landmarks, out)
+
+    def live_image2vec_multi(self, image):
+        """
+        Landmarks of every hand in a live frame, from a single pass of the hand tracking model
+        Region-of-interest tracking only follows a single hand, so it is not used here
+        Uses the static image model like `live_image2vec`: the classifier was trained on its landmarks,
+            and it is the model built by `warmup`
+        :return: (k, 63) float32 array, k being the number of detected hands (possibly 0);
+            written into a reused buffer, overwritten by the next frame
+        """
+        hands = self.predict_all_landmarks(image, train=True)
+        for landmarks, row in zip(hands, self._multi_buffer):
+            self._fill_vec(landmarks, row)
+        return self._multi_buffer[:len(hands)]
+
+    def image2vec_batch(self, images, train=True, out=None):
+        """
+        Produce landmark vectors for a batch of RGB images
+        :param images: sequence of N RGB images
+        :param train: whether to use the static image (train) or video stream (test) hands model
+        :param out: optional float32 array of shape (N, 63) to write the vectors into
+        :return: (N, 63) float32 array, rows of images without detected hands are NaN
+        """
+        if out is None:
+            out = np.empty((len(images), self.vec_dim), dtype='float32')
+        for image, row in zip(images, out):
+            if self.image2vec(image, train=train, out=row) is None:
+                row[:] = np.nan
+        return out
+
+    def live_image2vec(self, image):
+        # Landmarks of a live frame, written into the reused buffer (overwritten by the next frame)
+        # Live frames go through the static image model, as the training images did (see `warmup`)
+        if self.roi_tracker is not None:
+            vec = self.roi_tracker.image2vec(self, image, out=self._vec_buffer[0])
+        else:
+            vec = self.image2vec(image, out=self._vec_buffer[0])
+        if vec is not None:
+            self.last_vec = vec.copy()
         return vec
 
+    @property
+    def incremental(self):
+        # Whether the classifier can learn new samples without being refit from scratch
+        return hasattr(self.clf, 'partial_fit')
+
+    def partial_fit(self, landmarks, labels):
+        """
+        Add labeled landmark vectors to an incremental classifier (e.g. KNNClassifier), without retraining
+        :param landmarks: (N, 63) landmark vectors
+        :param labels: N integer labels
+        """
+        if not self.incremental:
+            raise TypeError(f'{type(self.clf).__name__} does not support incremental training')
+        self.clf.partial_fit(self.features(landmarks), labels)
+
+    def calibrate(self, label):
+        """
+        Add the landmarks of the last live frame as a sample of `label`, takes effect on the next frame
+        :return: True if a sample was added, False if no hand was detected yet
+        """
+        vec = self.last_vec
+        if vec is None:
+            return False
+        self.partial_fit(vec[None], [label])
+        return True
+
     def predict_image(self, image):
-        vec = self.image2vec(image)
+        vec = self.live_image2vec(image)
         if vec is None:
             return None
-        pred = self.clf.predict([vec])[0]
-        return pred
+        return self.classify(vec)
+
+    def classify(self, vec):
+        # Class of a single landmark vector
+        return self.clf.predict(self.features(vec[None]))[0]
+
+    def classify_batch(self, vecs):
+        # Classes of several landmark vectors (e.g. one per hand), in a single call to the classifier
+        if len(vecs) == 0:
+            return np.zeros(0, dtype='int64')
+        return self.clf.predict(self.features(vecs))
+
+    def decision_scores_batch(self, vecs):
+        # Per-class decision scores of several landmark vectors, (k, number of classes)
+        if len(vecs) == 0:
+            return np.zeros((0, len(self.classes)))
+        scores = self.clf.decision_function(self.features(vecs))
+        if np.ndim(scores) == 1:
+            scores = np.stack([-scores, scores], axis=1)
+        return scores
+
+    @property
+    def classes(self):
+        # Class labels in the order of the scores of `decision_scores` and `decision_scores_batch`
+        return self.clf.classes_ if hasattr(self.clf, 'classes_') else self.clf.classes
+
+    def decision_scores(self, vec):
+        # Per-class decision scores of a single landmark vector, aligned with `classes`
+        scores = self.clf.decision_function(self.features(vec[None]))[0]
+        if np.ndim(scores) == 0:
+            # Binary classifiers return a single score, positive for the second class
+            scores = np.array([-scores, scores])
+        return scores
 
     def predict_video_stream(self,
                              continuous=False,
                              plot_image=True,
                              show_capture=True,
-                             delay=1):
+                             delay=1,
+                             source=0):
 
         # Initialize window_size and video stream
         if show_capture:
             cv2.namedWindow('Test window_size')
-        capture = cv2.VideoCapture(0)
+        capture = open_source(source)
         ret, frame = capture.read()
 
         # Key presses don't register when no window_size is initialized
@@ -98,6 +404,7 @@ class GestureRecognizer:
                 print(f'Model prediction: [{pred}]')
 
                 if plot_image:
+                    import matplotlib.pyplot as plt
                     plt.axis('off')
                     plt.imshow(frame)
                     plt.title(f'Model prediction: [{pred}]')
@@ -109,6 +416,8 @@ class GestureRecognizer:
 
     def plot_landmarks(self, image):
         # Visualize the image and its predicted landmarks
+        from sklearn.exceptions import NotFittedError
+        mp = _import_mediapipe()
         landmarks = self.predict_landmarks(image)
         h, w, c = image.shape
 
@@ -128,7 +437,7 @@ class GestureRecognizer:
 
             # Make prediction if model is fitted
             try:
-                pred = self.clf.predict([self.image2vec(image_bak)])[0]
+                pred = self.classify(self.image2vec(image_bak))
                 title = str(pred) if self.class_map is None else self.class_map[pred]
             except NotFittedError as e:
                 title = 'Model not fitted'
@@ -139,3 +448,170 @@ class GestureRecognizer:
             cv2.destroyWindow(title)
         else:
             print('No hand detected in image.')
+
+
+class FilterMetrics:
+    """
+    Flicker and latency of a PredictionFilter's output compared to the raw predictions
+    """
+    def __init__(self):
+        self.raw_changes = 0
+        self.output_changes = 0
+        self.latencies = []  # delay of each output switch behind the raw prediction it follows
+        self._start = self._end = None
+        self._raw = self._output = None
+        self._raw_since = None  # time the raw prediction switched to its current value
+
+    def update(self, raw, output, timestamp):
+        if self._start is None:
+            self._start = self._raw_since = timestamp
+        else:
+            if raw != self._raw:
+                self.raw_changes += 1
+                self._raw_since = timestamp
+            if output != self._output:
+                self.output_changes += 1
+                if output == raw:
+                    self.latencies.append(timestamp - self._raw_since)
+        self._raw, self._output, self._end = raw, output, timestamp
+
+    @property
+    def duration(self):
+        return 0. if self._start is None else self._end - self._start
+
+    @property
+    def raw_flicker_rate(self):
+        # Prediction changes per second
+        return self.raw_changes / self.duration if self.duration > 0 else 0.
+
+    @property
+    def flicker_rate(self):
+        return self.output_changes / self.duration if self.duration > 0 else 0.
+
+    @property
+    def mean_latency(self):
+        return float(np.mean(self.latencies)) if self.latencies else 0.
+
+    def summary(self):
+        return {
+            'duration': self.duration,
+            'raw_flicker_rate': self.raw_flicker_rate,
+            'flicker_rate': self.flicker_rate,
+            'mean_added_latency': self.mean_latency,
+            'max_added_latency': max(self.latencies, default=0.)
+        }
+
+
+class PredictionFilter:
+    """
+    Streaming filter turning jittery per-frame predictions into stable control
+    'vote': majority vote over the predictions of the last `2 * latency_budget` seconds
+    'ema': exponential smoothing of decision scores, with a time constant of `latency_budget / 3`
+    The output only switches class when the new class leads the current one by `hysteresis`
+        (vote fraction or score), and short losses of the hand (under `latency_budget`) are ignored
+    Both work on timestamps rather than frame counts, so inference can run at any rate
+    """
+    def __init__(self, classes, mode='vote', latency_budget=0.15, hysteresis=0.2):
+        """
+        :param classes: class labels, aligned with the scores passed to `update`
+        :param mode: 'vote' or 'ema'
+        :param latency_budget: roughly the delay, in seconds, the filter may add to a change of gesture
+        :param hysteresis: lead a new class needs over the current output to replace it
+        """
+        if mode not in ('vote', 'ema'):
+            raise ValueError(f'Unknown filter mode `{mode}`')
+        self.classes = np.asarray(classes)
+        self.mode = mode
+        self.latency_budget = latency_budget
+        self.hysteresis = hysteresis
+
+        self.current = None  # index of the class currently output, None when no hand
+        self.metrics = FilterMetrics()
+
+        self._votes = deque()  # (timestamp, class index + 1), 0 stands for no hand
+        self._scores = None  # smoothed scores
+        self._last_seen = None  # last time a hand was detected
+
+    def set_classes(self, classes):
+        """
+        Follow a change of the classifier's classes (e.g. a class added by live calibration), the votes and
+            smoothed scores of the classes that are kept carry over
+        """
+        classes = np.asarray(classes)
+        if np.array_equal(classes, self.classes):
+            return
+        new_index = {class_: i for i, class_ in enumerate(classes.tolist())}
+        if not all(class_ in new_index for class_ in self.classes.tolist()):
+            # Classes were removed, start over
+            self.classes, self.current = classes, None
+            self._votes.clear()
+            self._scores = None
+            return
+
+        mapping = np.array([new_index[class_] for class_ in self.classes.tolist()], dtype='int64')
+        self._votes = deque((t, 0 if vote == 0 else int(mapping[vote - 1]) + 1) for t, vote in self._votes)
+        if self._scores is not None:
+            scores = np.full(len(classes), self._scores.min())
+            scores[mapping] = self._scores
+            self._scores = scores
+        if self.current is not None:
+            self.current = int(mapping[self.current])
+        self.classes = classes
+
+    def update(self, scores, timestamp=None, classes=None):
+        """
+        :param scores: per-class decision scores of the latest frame, None if no hand was detected
+        :param timestamp: capture time of the frame, in seconds
+        :param classes: classes the scores are aligned with, when they may change (see `set_classes`)
+        :return: filtered class label, None when no hand
+        """
+        timestamp = perf_counter() if timestamp is None else timestamp
+        if classes is not None:
+            self.set_classes(classes)
+        if scores is not None and len(scores) != len(self.classes):
+            # Scored just before a class was added, skip the frame
+            return None if self.current is None else self.classes[self.current]
+        raw = None if scores is None else int(np.argmax(scores))
+
+        if self.mode == 'vote':
+            output = self._update_vote(raw, timestamp)
+        else:
+            output = self._update_ema(scores, timestamp)
+
+        self.metrics.update(raw, output, timestamp)
+        self.current = output
+        return None if output is None else self.classes[output]
+
+    def _update_vote(self, raw, timestamp):
+        self._votes.append((timestamp, 0 if raw is None else raw + 1))
+        while self._votes[0][0] < timestamp - 2 * self.latency_budget:
+            self._votes.popleft()
+
+        counts = np.bincount([vote for _, vote in self._votes], minlength=len(self.classes) + 1)
+        fractions = counts / len(self._votes)
+        best = int(np.argmax(fractions))
+        current = 0 if self.current is None else self.current + 1
+        if fractions[best] - fractions[current] > self.hysteresis:
+            current = best
+        return None if current == 0 else current - 1
+
+    def _update_ema(self, scores, timestamp):
+        if scores is None:
+            # Keep the current output through short detection dropouts
+            if self._last_seen is None or timestamp - self._last_seen > self.latency_budget:
+                self._scores = None
+                return None
+            return self.current
+
+        scores = np.asarray(scores, dtype='float64')
+        if self._scores is None:
+            self._scores = scores.copy()
+        else:
+            alpha = 1 - np.exp(-(timestamp - self._last_seen) / (self.latency_budget / 3))
+            self._scores += alpha * (scores - self._scores)
+        self._last_seen = timestamp
+
+        best = int(np.argmax(self._scores))
+        if self.current is None or self._scores[best] - self._scores[self.current] > self.hysteresis:
+            return best
+        return self.current
@@ -0,0 +1,131 @@
+import os
+import json
+from functools import lru_cache
+import numpy as np
+
+
+INDEX_NAME = 'index.json'
+
+
+def is_packed(dataset_dir):
+    return os.path.exists(os.path.join(dataset_dir, INDEX_NAME))
+
+
+@lru_cache(maxsize=16)
+def open_shard(shard_path):
+    # Memory-mapped shard, kept open so that random reads don't reopen the file every time
+    return np.load(shard_path, mmap_mode='r')
+
+
+class PackedDataset:
+    """
+    Dataset of RGB uint8 images stored in sharded .npy files plus a JSON index, instead of one JPEG per sample
+    Shards are memory-mapped, so any image can be read without decoding or listing directories
+    Shards are never modified once written: every call to `append` (e.g. a collection session) adds new shards
+    """
+    def __init__(self, dataset_dir, image_shape=(224, 224, 3), shard_size=512):
+        """
+        :param dataset_dir: directory of the packed dataset, created if it does not exist
+        :param image_shape: shape of every image, only used when creating a new dataset
+        :param shard_size: maximum number of images per shard
+        """
+        self.dataset_dir = dataset_dir
+        self.shard_size = shard_size
+        self.index_path = os.path.join(dataset_dir, INDEX_NAME)
+
+        if os.path.exists(self.index_path):
+            with open(self.index_path, 'r') as f:
+                self.index = json.load(f)
+        else:
+            os.makedirs(dataset_dir, exist_ok=True)
+            self.index = {'image_shape': list(image_shape), 'shards': []}
+            self._save_index()
+        self.image_shape = tuple(self.index['image_shape'])
+
+        self._update_offsets()
+
+    def _update_offsets(self):
+        counts = [len(shard['labels']) for shard in self.index['shards']]
+        self._offsets = np.concatenate([[0], np.cumsum(counts)]).astype('int64')
+
+    def _save_index(self):
+        tmp_path = self.index_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.index, f)
+        os.replace(tmp_path, self.index_path)
+
+    def shard_path(self, i):
+        return os.path.join(self.dataset_dir, self.index['shards'][i]['name'])
+
+    def __len__(self):
+        return int(self._offsets[-1])
+
+    def __getitem__(self, i):
+        """
+        :return: image (read-only view into the memory-mapped shard), label
+        """
+        if i < 0:
+            i += len(self)
+        shard = int(np.searchsorted(self._offsets, i, side='right')) - 1
+        offset = i - self._offsets[shard]
+        return open_shard(self.shard_path(shard))[offset], self.index['shards'][shard]['labels'][offset]
+
+    @property
+    def labels(self):
+        return np.array([label for shard in self.index['shards'] for label in shard['labels']], dtype='int64')
+
+    def samples(self):
+        # (shard path, offset in shard, label) of every image
+        return [
+            (self.shard_path(i), offset, label)
+            for i, shard in enumerate(self.index['shards'])
+            for offset, label in enumerate(shard['labels'])
+        ]
+
+    def append(self, images, labels):
+        """
+        Add a batch of images as new shards
+        :param images: RGB uint8 images, (N, *image_shape)
+        :param labels: N integer labels
+        """
+        images = np.asarray(images, dtype='uint8')
+        labels = [int(label) for label in labels]
+        if len(images) == 0:
+            return
+        if images.shape[1:] != self.image_shape:
+            raise ValueError(f'Expected images of shape {self.image_shape}, got {images.shape[1:]}')
+
+        for start in range(0, len(images), self.shard_size):
+            name = f'shard_{len(self.index["shards"]):05d}.npy'
+            # Write to a temporary file first so that an interrupted session never leaves a partial shard
+            tmp_path = os.path.join(self.dataset_dir, name + '.tmp.npy')
+            np.save(tmp_path, images[start:start + self.shard_size])
+            os.replace(tmp_path, os.path.join(self.dataset_dir, name))
+            self.index['shards'].append({'name': name, 'labels': labels[start:start + self.shard_size]})
+            self._save_index()
+        self._update_offsets()
+
+
+def pack_directory(dataset_dir, packed_dir, shard_size=512, batch_size=None):
+    """
+    Pack a dataset stored as JPEG files (one sub-directory per class) into a PackedDataset
+    :param dataset_dir: root directory of the image dataset
+    :param packed_dir: directory of the packed dataset, images are appended if it already exists
+    :param shard_size: maximum number of images per shard
+    :param batch_size: number of images decoded before being written, defaults to `shard_size`
+    :return: PackedDataset
+    """
+    import cv2
+    from tqdm import tqdm
+    from utils.datasets import list_dataset
+
+    packed = PackedDataset(packed_dir, shard_size=shard_size)
+    files, _ = list_dataset(dataset_dir)
+    batch_size = batch_size or shard_size
+
+    for start in tqdm(range(0, len(files), batch_size), ncols=80):
+        batch = files[start:start + batch_size]
+        # OpenCV reads images in BGR format
+        images = [cv2.cvtColor(cv2.imread(path), cv2.COLOR_BGR2RGB) for path, _, _ in batch]
+        packed.append(images, [label for _, _, label in batch])
+    return packed
@@ -0,0 +1,352 @@
+import os
+import threading
+import time
+
+from utils.images import process_frame
+from utils.profiling import NullTracer
+
+
+class LatestValue:
+    """
+    Single-slot buffer that only ever holds the most recent value
+    Writers overwrite whatever is in the slot, so readers never work through a backlog of stale items
+    """
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._value = None
+        self._timestamp = None
+        self._seq = 0  # incremented on every put
+        self._read_seq = 0  # last sequence number handed to a reader
+        self._dropped = 0  # number of values overwritten before being read
+
+    def put(self, value, timestamp=None):
+        """
+        Publish a new value, replacing the previous one
+        :param value: value to publish
+        :param timestamp: time associated with the value, defaults to now (perf_counter)
+        :return: True if an unread value was overwritten (i.e. dropped)
+        """
+        with self._cond:
+            dropped = self._seq > self._read_seq
+            if dropped:
+                self._dropped += 1
+            self._value = value
+            self._timestamp = time.perf_counter() if timestamp is None else timestamp
+            self._seq += 1
+            self._cond.notify_all()
+        return dropped
+
+    @property
+    def dropped(self):
+        with self._cond:
+            return self._dropped
+
+    def get(self):
+        """
+        Non-blocking read of the latest value
+        :return: value, timestamp, sequence number (value is None if nothing was published yet)
+        """
+        with self._cond:
+            self._read_seq = self._seq
+            return self._value, self._timestamp, self._seq
+
+    def wait_newer(self, seq, timeout=None):
+        """
+        Block until a value newer than `seq` is published
+        :param seq: sequence number of the last value seen by the caller
+        :param timeout: maximum time to wait in seconds
+        :return: value, timestamp, sequence number; value is None on timeout
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._seq > seq, timeout=timeout):
+                return None, None, seq
+            self._read_seq = self._seq
+            return self._value, self._timestamp, self._seq
+
+
+class RateCounter:
+    """
+    Counts events and reports their rate, averaged over a short window
+    """
+    def __init__(self, window=1.0):
+        self.window = window
+        self.count = 0  # total number of events
+        self.rate = 0.
+
+        self._lock = threading.Lock()
+        self._window_start = time.perf_counter()
+        self._window_count = 0
+
+    def tick(self):
+        with self._lock:
+            self.count += 1
+            self._window_count += 1
+
+            now = time.perf_counter()
+            elapsed = now - self._window_start
+            if elapsed >= self.window:
+                self.rate = self._window_count / elapsed
+                self._window_start, self._window_count = now, 0
+
+
+class InferenceScheduler:
+    """
+    Decides how long the inference thread rests between two frames, based on what is happening in the game
+    - danger: while an enemy is close to the player, every frame is processed (no rest at all)
+    - stability: the longer the prediction stays the same (static hand), the longer the rest, up to
+        `max_interval`; no detected hand rests the longest
+    - CPU headroom: when the process uses most of the machine's CPU, inference is limited to a fraction
+        `max_duty` of the time, unless in danger
+    """
+    def __init__(self, max_interval=0.2, stable_time=0.5, no_hand_interval=None, max_duty=0.5, min_headroom=0.2):
+        """
+        :param max_interval: longest rest between two inferences, in seconds
+        :param stable_time: time a prediction must stay the same before inference starts to slow down
+        :param no_hand_interval: rest while no hand is detected, defaults to `max_interval`
+        :param max_duty: fraction of the time inference may run when CPU is scarce
+        :param min_headroom: fraction of the machine's CPU that must stay free before inference is limited
+        """
+        self.max_interval = max_interval
+        self.stable_time = stable_time
+        self.no_hand_interval = max_interval if no_hand_interval is None else no_hand_interval
+        self.max_duty = max_duty
+        self.min_headroom = min_headroom
+
+        self.danger = False
+        self._wakeup = threading.Event()  # interrupts a rest when danger appears
+        self._pred = None
+        self._pred_since = None  # time the prediction switched to its current value
+
+        # CPU usage of the whole process, relative to every core of the machine
+        self.cpu_load = 0.
+        self._num_cpus = os.cpu_count() or 1
+        self._cpu_time, self._wall_time = time.process_time(), time.perf_counter()
+
+        # Statistics
+        self.decisions = 0
+        self.total_interval = 0.
+
+    def set_danger(self, danger):
+        # Called by the game loop every frame, e.g. when an enemy is within reach of the player
+        if danger and not self.danger:
+            self._wakeup.set()
+        self.danger = danger
+
+    def _update_load(self):
+        cpu_time, wall_time = time.process_time(), time.perf_counter()
+        elapsed = wall_time - self._wall_time
+        if elapsed >= 0.25:
+            load = (cpu_time - self._cpu_time) / (elapsed * self._num_cpus)
+            self.cpu_load = 0.5 * self.cpu_load + 0.5 * load
+            self._cpu_time, self._wall_time = cpu_time, wall_time
+
+    def interval(self, pred, timestamp, inference_time):
+        """
+        :param pred: latest prediction, None if no hand was detected (tuple of the players' predictions in
+            multiplayer sessions)
+        :param timestamp: time of the frame it was made from
+        :param inference_time: time it took to process the frame, in seconds
+        :return: time to rest before processing the next frame, in seconds
+        """
+        self._update_load()
+        if pred != self._pred or self._pred_since is None:
+            self._pred, self._pred_since = pred, timestamp
+
+        if self.danger:
+            interval = 0.
+        else:
+            if pred is None or (isinstance(pred, tuple) and all(p is None for p in pred)):
+                interval = self.no_hand_interval
+            else:
+                # Ramps up from 0 to `max_interval` over `stable_time` once the prediction is stable
+                stable_for = timestamp - self._pred_since - self.stable_time
+                interval = self.max_interval * min(max(stable_for / self.stable_time, 0.), 1.)
+            if 1 - self.cpu_load < self.min_headroom:
+                interval = max(interval, inference_time * (1 / self.max_duty - 1))
+
+        self.decisions += 1
+        self.total_interval += interval
+        return interval
+
+    def wait(self, interval, stop):
+        # Rest for `interval` seconds, cut short by danger or by the pipeline stopping
+        self._wakeup.clear()
+        deadline = time.perf_counter() + interval
+        while not stop.is_set() and not self.danger:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            self._wakeup.wait(min(remaining, 0.05))
+
+    @property
+    def mean_interval(self):
+        return self.total_interval / self.decisions if self.decisions else 0.
+
+
+class GesturePipeline:
+    """
+    Runs webcam capture and gesture inference in background threads
+    The capture thread always keeps the newest frame, the inference thread always works on the newest frame,
+        and the game loop reads the newest prediction without ever waiting on the camera or MediaPipe
+    """
+    def __init__(self, capture, recognizer, preprocess=process_frame, warmup=True, prediction_filter=None,
+                 tracer=None, hand_assigner=None, scheduler=None):
+        """
+        :param capture: object with a cv2.VideoCapture-like `read()` method, or a function returning one,
+            in which case the (often slow) opening of the camera happens in the capture thread
+        :param recognizer: GestureRecognizer used for predictions
+        :param preprocess: function applied to each captured frame before inference
+        :param warmup: whether to build and warm up the recognizer's model in the inference thread before
+            the first frame, so that the (slow) model initialization never blocks the game loop
+        :param prediction_filter: optional PredictionFilter applied to the decision scores of every frame
+        :param tracer: optional FrameTracer timing the capture, preprocess, landmarks and classify stages
+        :param hand_assigner: HandAssigner for multiplayer sessions: every hand of a frame is found in one pass,
+            all hands are classified in one batch, and each prediction is a list with one entry per player;
+            `prediction_filter` is then a list with one PredictionFilter per player (or None)
+        :param scheduler: optional InferenceScheduler deciding how long to rest between frames,
+            frames captured in the meantime are skipped
+        """
+        self.capture = capture
+        self.recognizer = recognizer
+        self.preprocess = preprocess
+        self.warmup = warmup
+        self.ready = threading.Event()  # set once the model is warmed up
+        self.prediction_filter = prediction_filter
+        self.tracer = NullTracer() if tracer is None else tracer
+        self.hand_assigner = hand_assigner
+        self.scheduler = scheduler
+
+        self._frames = LatestValue()
+        self._predictions = LatestValue()
+        self._stop = threading.Event()
+        self._threads = []
+
+        # Performance counters
+        self.capture_counter = RateCounter()
+        self.inference_counter = RateCounter()
+
+    @property
+    def capture_fps(self):
+        return self.capture_counter.rate
+
+    @property
+    def inference_fps(self):
+        return self.inference_counter.rate
+
+    @property
+    def frames_dropped(self):
+        # Counted by the frame buffer under its lock, as frames are replaced in the capture thread
+        return self._frames.dropped
+
+    @property
+    def running(self):
+        return not self._stop.is_set()
+
+    def start(self):
+        self._stop.clear()
+        self._threads = [
+            threading.Thread(target=self._capture_loop, name='capture', daemon=True),
+            threading.Thread(target=self._inference_loop, name='inference', daemon=True)
+        ]
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def stop(self, timeout=1.0):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def latest(self):
+        """
+        Most recent prediction and the capture time of the frame it was made from
+        :return: prediction (None if no hand was detected or nothing was predicted yet; a list with one
+            prediction per player with a `hand_assigner`), timestamp
+        """
+        pred, timestamp, _ = self._predictions.get()
+        return pred, timestamp
+
+    def _capture_loop(self):
+        # End of stream, camera failure or any error shuts down the whole pipeline
+        try:
+            if not hasattr(self.capture, 'read'):
+                self.capture = self.capture()
+
+            tracer = self.tracer
+            while not self._stop.is_set():
+                tracer.new_frame()
+                with tracer.span('capture'):
+                    ret, frame = self.capture.read()
+                if not ret:
+                    break
+
+                # Frames the inference thread did not get to are simply replaced
+                self._frames.put(frame)
+                self.capture_counter.tick()
+        finally:
+            self._stop.set()
+
+    def _inference_loop(self):
+        try:
+            if self.warmup:
+                # Single and multiplayer live frames both use the static image model that `warmup` builds
+                self.recognizer.warmup()
+            self.ready.set()
+
+            seq = 0
+            recognizer, tracer = self.recognizer, self.tracer
+            while not self._stop.is_set():
+                frame, timestamp, new_seq = self._frames.wait_newer(seq, timeout=0.1)
+                if frame is None:
+                    continue
+                seq = new_seq
+
+                tracer.new_frame()
+                start = time.perf_counter()
+                with tracer.span('preprocess'):
+                    frame = self.preprocess(frame)
+                if self.hand_assigner is not None:
+                    pred = self._predict_players(frame, timestamp)
+                else:
+                    with tracer.span('landmarks'):
+                        vec = recognizer.live_image2vec(frame)
+                    with tracer.span('classify'):
+                        if self.prediction_filter is not None:
+                            scores = None if vec is None else recognizer.decision_scores(vec)
+                            # Live calibration may add classes while the game runs
+                            pred = self.prediction_filter.update(scores, timestamp, recognizer.classes)
+                        else:
+                            pred = None if vec is None else recognizer.classify(vec)
+                self._predictions.put(pred, timestamp)
+                self.inference_counter.tick()
+
+                if self.scheduler is not None:
+                    # With several players, inference only slows down once every player's prediction is stable
+                    state = tuple(pred) if self.hand_assigner is not None else pred
+                    interval = self.scheduler.interval(state, timestamp, time.perf_counter() - start)
+                    self.scheduler.wait(interval, self._stop)
+        finally:
+            self._stop.set()
+
+    def _predict_players(self, frame, timestamp):
+        # One prediction per player, None for players whose hand is not visible
+        recognizer, tracer = self.recognizer, self.tracer
+        with tracer.span('landmarks'):
+            vecs = recognizer.live_image2vec_multi(frame)
+            hands = self.hand_assigner.assign(vecs, timestamp)
+        with tracer.span('classify'):
+            if self.prediction_filter is not None:
+                scores = recognizer.decision_scores_batch(vecs)
+                return [
+                    prediction_filter.update(None if hand < 0 else scores[hand], timestamp, recognizer.classes)
+                    for prediction_filter, hand in zip(self.prediction_filter, hands)
+                ]
+            classes = recognizer.classify_batch(vecs)
+            return [None if hand < 0 else classes[hand] for hand in hands]
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
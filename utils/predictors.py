@@ -0,0 +1,345 @@
+import numpy as np
+import pickle
+import threading
+
+
+class SVCPredictor:
+    """
+    NumPy-only predictor for a fitted RBF `sklearn.svm.SVC`
+    Reproduces libsvm's one-vs-one voting from plain arrays, so inference needs neither sklearn
+        nor its per-call input validation
+    """
+    kind = 'svc'
+
+    def __init__(self, support_vectors, dual_coef, intercept, n_support, classes, gamma):
+        """
+        Arrays follow libsvm's conventions (`SVC._dual_coef_` and `SVC._intercept_`)
+        :param support_vectors: (n_SV, n_features) support vectors, grouped by class
+        :param dual_coef: (n_classes - 1, n_SV) dual coefficients
+        :param intercept: (n_classes * (n_classes - 1) / 2,) intercepts of the one-vs-one classifiers
+        :param n_support: number of support vectors of each class
+        :param classes: class labels
+        :param gamma: RBF kernel coefficient
+        """
+        self.support_vectors = np.asarray(support_vectors, dtype='float64')
+        self.dual_coef = np.asarray(dual_coef, dtype='float64')
+        self.intercept = np.asarray(intercept, dtype='float64')
+        self.n_support = np.asarray(n_support, dtype='int64')
+        self.classes = np.asarray(classes)
+        self.gamma = float(gamma)
+
+        # Precompute squared norms of the support vectors for the kernel
+        self._sv_sq_norms = np.einsum('ij,ij->i', self.support_vectors, self.support_vectors)
+
+        # Coefficients of every one-vs-one classifier over all support vectors, so that all
+        #   decision values are a single matrix product: (n_pairs, n_SV)
+        n_classes = len(self.classes)
+        starts = np.concatenate([[0], np.cumsum(self.n_support)])
+        self._pairs = [(i, j) for i in range(n_classes) for j in range(i + 1, n_classes)]
+        self._pair_i, self._pair_j = np.array(self._pairs, dtype='int64').reshape(-1, 2).T
+        self._class_range = np.arange(n_classes)
+        self._pair_coef = np.zeros((len(self._pairs), len(self.support_vectors)))
+        for p, (i, j) in enumerate(self._pairs):
+            self._pair_coef[p, starts[i]:starts[i + 1]] = self.dual_coef[j - 1, starts[i]:starts[i + 1]]
+            self._pair_coef[p, starts[j]:starts[j + 1]] = self.dual_coef[i, starts[j]:starts[j + 1]]
+
+    @classmethod
+    def from_sklearn(cls, clf):
+        if clf.kernel != 'rbf':
+            raise ValueError(f'Only RBF kernels can be exported, got `{clf.kernel}`')
+
+        dual_coef, intercept = clf.dual_coef_, clf.intercept_
+        # sklearn flips the signs of the public attributes for binary problems
+        if len(clf.classes_) == 2:
+            dual_coef, intercept = -dual_coef, -intercept
+
+        return cls(
+            support_vectors=clf.support_vectors_,
+            dual_coef=dual_coef,
+            intercept=intercept,
+            n_support=clf.n_support_,
+            classes=clf.classes_,
+            gamma=clf._gamma
+        )
+
+    def _ovo_decision(self, X):
+        # libsvm's decision values of each one-vs-one classifier: (n_samples, n_pairs)
+        X = np.asarray(X, dtype='float64')
+        sq_dists = np.einsum('ij,ij->i', X, X)[:, None] + self._sv_sq_norms - 2 * X @ self.support_vectors.T
+        kernel = np.exp(-self.gamma * np.maximum(sq_dists, 0))
+        return kernel @ self._pair_coef.T + self.intercept
+
+    def predict(self, X):
+        dec = self._ovo_decision(X)
+        winners = np.where(dec > 0, self._pair_i, self._pair_j)
+        votes = (winners[:, :, None] == self._class_range).sum(axis=1)
+        # Ties go to the class with the lowest index, like libsvm
+        return self.classes[np.argmax(votes, axis=1)]
+
+    def decision_function(self, X):
+        """
+        Same output as `SVC.decision_function` with the default 'ovr' shape
+        :return: (n_samples, n_classes) scores, or (n_samples,) for binary problems
+        """
+        dec = self._ovo_decision(X)
+        n_classes = len(self.classes)
+        if n_classes == 2:
+            return -dec[:, 0]
+
+        votes = np.zeros((len(dec), n_classes))
+        confidences = np.zeros((len(dec), n_classes))
+        for p, (i, j) in enumerate(self._pairs):
+            confidences[:, i] += dec[:, p]
+            confidences[:, j] -= dec[:, p]
+            votes[:, i] += dec[:, p] >= 0
+            votes[:, j] += dec[:, p] < 0
+        return votes + confidences / (3 * (np.abs(confidences) + 1))
+
+    def score(self, X, y):
+        return np.mean(self.predict(X) == np.asarray(y))
+
+    def save(self, path):
+        np.savez(
+            path,
+            kind=self.kind,
+            support_vectors=self.support_vectors,
+            dual_coef=self.dual_coef,
+            intercept=self.intercept,
+            n_support=self.n_support,
+            classes=self.classes,
+            gamma=self.gamma
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(
+                support_vectors=data['support_vectors'],
+                dual_coef=data['dual_coef'],
+                intercept=data['intercept'],
+                n_support=data['n_support'],
+                classes=data['classes'],
+                gamma=data['gamma']
+            )
+
+
+class LinearPredictor:
+    """
+    NumPy-only predictor for a fitted linear classifier (e.g. `sklearn.linear_model.LogisticRegression`)
+    """
+    kind = 'linear'
+
+    def __init__(self, coef, intercept, classes):
+        self.coef = np.asarray(coef, dtype='float64')
+        self.intercept = np.asarray(intercept, dtype='float64')
+        self.classes = np.asarray(classes)
+
+    @classmethod
+    def from_sklearn(cls, clf):
+        return cls(coef=clf.coef_, intercept=clf.intercept_, classes=clf.classes_)
+
+    def decision_function(self, X):
+        # Same shapes as sklearn: a single column is flattened for binary problems
+        scores = np.asarray(X, dtype='float64') @ self.coef.T + self.intercept
+        return scores.ravel() if scores.shape[1] == 1 else scores
+
+    def predict(self, X):
+        scores = self.decision_function(X)
+        if scores.ndim == 1:
+            return self.classes[(scores > 0).astype('int64')]
+        return self.classes[np.argmax(scores, axis=1)]
+
+    def score(self, X, y):
+        return np.mean(self.predict(X) == np.asarray(y))
+
+    def save(self, path):
+        np.savez(path, kind=self.kind, coef=self.coef, intercept=self.intercept, classes=self.classes)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(coef=data['coef'], intercept=data['intercept'], classes=data['classes'])
+
+
+class KNNClassifier:
+    """
+    k-nearest-neighbor classifier over landmark vectors that learns incrementally
+    `partial_fit` absorbs new labeled samples in microseconds (they are appended to the index), so
+        per-user calibration samples can be added live; with `max_samples_per_class`, the oldest samples
+        of a class are forgotten first, letting recent calibration samples take over
+    Safe to update from one thread while another thread predicts
+    """
+    kind = 'knn'
+
+    def __init__(self, n_neighbors=5, max_samples_per_class=None):
+        self.n_neighbors = n_neighbors
+        self.max_samples_per_class = max_samples_per_class
+
+        self.classes = np.zeros(0, dtype='int64')
+        self._X = np.zeros((0, 0), dtype='float32')
+        self._y = np.zeros(0, dtype='int64')
+        self._age = np.zeros(0, dtype='int64')  # insertion order, used to forget the oldest samples
+        self._count = 0
+        self._next_age = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._count
+
+    # The lock can't be pickled, a new one is created when unpickling
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def fit(self, X, y):
+        with self._lock:
+            self._count = 0
+            self.classes = np.zeros(0, dtype='int64')
+        return self.partial_fit(X, y)
+
+    def partial_fit(self, X, y):
+        """
+        Add labeled samples to the index
+        :param X: (n_samples, n_features) landmark vectors
+        :param y: n_samples labels
+        """
+        if len(y) == 0:
+            return self
+        X = np.asarray(X, dtype='float32').reshape(len(y), -1)
+        y = np.asarray(y, dtype='int64')
+        with self._lock:
+            self._reserve(len(X), X.shape[1])
+            new = slice(self._count, self._count + len(X))
+            self._X[new], self._y[new] = X, y
+            self._age[new] = np.arange(self._next_age, self._next_age + len(X))
+            self._count += len(X)
+            self._next_age += len(X)
+            self.classes = np.union1d(self.classes, y)
+
+            if self.max_samples_per_class is not None:
+                self._forget()
+        return self
+
+    def _reserve(self, n, dim):
+        if self._X.shape[1] != dim:
+            if self._count > 0:
+                raise ValueError(f'Expected {self._X.shape[1]} features, got {dim}')
+            self._X = np.zeros((0, dim), dtype='float32')
+        capacity = len(self._X)
+        if self._count + n <= capacity:
+            return
+        capacity = max(2 * capacity, self._count + n, 64)
+        for name in ['_X', '_y', '_age']:
+            array = getattr(self, name)
+            grown = np.zeros((capacity, *array.shape[1:]), dtype=array.dtype)
+            grown[:self._count] = array[:self._count]
+            setattr(self, name, grown)
+
+    def _forget(self):
+        # Keep only the most recent `max_samples_per_class` samples of every class
+        y, age = self._y[:self._count], self._age[:self._count]
+        keep = np.ones(self._count, dtype=bool)
+        for class_ in self.classes:
+            rows = np.flatnonzero(y == class_)
+            if len(rows) > self.max_samples_per_class:
+                oldest = rows[np.argsort(age[rows])[:len(rows) - self.max_samples_per_class]]
+                keep[oldest] = False
+        if not keep.all():
+            kept = np.flatnonzero(keep)
+            for array in [self._X, self._y, self._age]:
+                array[:len(kept)] = array[kept]
+            self._count = len(kept)
+
+    def decision_function(self, X):
+        """
+        Distance-weighted votes of the nearest neighbors
+        :return: (n_samples, n_classes) scores in [0, 1], aligned with `classes`
+        """
+        X = np.asarray(X, dtype='float32')
+        with self._lock:
+            samples, labels, classes = self._X[:self._count], self._y[:self._count], self.classes
+            if len(samples) == 0:
+                raise ValueError('Classifier has no samples, call `fit` or `partial_fit` first')
+
+            sq_dists = (
+                np.einsum('ij,ij->i', X, X)[:, None] - 2 * X @ samples.T +
+                np.einsum('ij,ij->i', samples, samples)
+            )
+            k = min(self.n_neighbors, len(samples))
+            neighbors = np.argpartition(sq_dists, k - 1, axis=1)[:, :k]
+            neighbor_labels = labels[neighbors]
+
+        dists = np.sqrt(np.maximum(np.take_along_axis(sq_dists, neighbors, axis=1), 0))
+        weights = 1 / (dists + 1e-6)
+        scores = (weights[:, :, None] * (neighbor_labels[:, :, None] == classes)).sum(axis=1)
+        return scores / weights.sum(axis=1, keepdims=True)
+
+    def predict(self, X):
+        return self.classes[np.argmax(self.decision_function(X), axis=1)]
+
+    def score(self, X, y):
+        return np.mean(self.predict(X) == np.asarray(y))
+
+    def save(self, path):
+        with self._lock:
+            np.savez(
+                path,
+                kind=self.kind,
+                X=self._X[:self._count],
+                y=self._y[:self._count],
+                n_neighbors=self.n_neighbors,
+                max_samples_per_class=-1 if self.max_samples_per_class is None else self.max_samples_per_class
+            )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            max_samples_per_class = int(data['max_samples_per_class'])
+            clf = cls(int(data['n_neighbors']), None if max_samples_per_class < 0 else max_samples_per_class)
+            if len(data['y']) > 0:
+                clf.partial_fit(data['X'], data['y'])
+        return clf
+
+
+def export_classifier(clf):
+    """
+    NumPy-only equivalent of a fitted classifier, used for inference and saved with `save`
+    :param clf: fitted sklearn SVC or linear model, or an already exportable classifier (returned as is)
+    """
+    if hasattr(clf, 'save'):
+        return clf
+    if hasattr(clf, 'support_vectors_'):
+        return SVCPredictor.from_sklearn(clf)
+    if hasattr(clf, 'coef_'):
+        return LinearPredictor.from_sklearn(clf)
+    raise ValueError(f'{type(clf).__name__} can not be exported')
+
+
+def load_classifier(path):
+    """
+    Load a saved classifier: exported arrays (.npz) or a pickled sklearn model (.pkl)
+    Only the classifier of models saved with a feature transform is returned, `GestureRecognizer.load`
+        loads both
+    :param path: path of the saved model
+    :return: object with a `predict` method
+    """
+    if path.endswith('.npz'):
+        with np.load(path) as data:
+            kind = str(data['kind'])
+        if kind == SVCPredictor.kind:
+            return SVCPredictor.load(path)
+        if kind == KNNClassifier.kind:
+            return KNNClassifier.load(path)
+        if kind == LinearPredictor.kind:
+            return LinearPredictor.load(path)
+        raise ValueError(f'Unknown exported classifier type `{kind}`')
+
+    with open(path, 'rb') as f:
+        clf = pickle.load(f)
+    # Pickled with its feature transform (see `GestureRecognizer.save`)
+    return clf['clf'] if isinstance(clf, dict) else clf
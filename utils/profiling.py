@@ -0,0 +1,177 @@
+import json
+import threading
+from contextlib import nullcontext
+from time import perf_counter
+import numpy as np
+
+
+class StartupTimer:
+    """
+    Records named milestones of the program's startup, relative to when the timer was created
+    """
+    def __init__(self):
+        self.start = perf_counter()
+        self.marks = []  # (name, seconds since start)
+        self._lock = threading.Lock()
+
+    def mark(self, name):
+        with self._lock:
+            self.marks.append((name, perf_counter() - self.start))
+
+    def report(self):
+        lines = ['Startup timing:']
+        prev = 0.
+        for name, elapsed in sorted(self.marks, key=lambda mark: mark[1]):
+            lines.append(f'  {name:<24}{elapsed * 1000:>9.1f} ms  (+{(elapsed - prev) * 1000:.1f} ms)')
+            prev = elapsed
+        return '\n'.join(lines)
+
+
+# Stages of a frame, in the order they are drawn in the overlay
+STAGES = ['capture', 'preprocess', 'landmarks', 'classify', 'physics', 'enemies', 'render', 'flip']
+
+SPAN_DTYPE = np.dtype([
+    ('stage', 'u1'),
+    ('thread', 'u1'),
+    ('frame', 'i8'),  # frame number, counted separately by each thread
+    ('start', 'f8'),  # seconds, perf_counter
+    ('end', 'f8')
+])
+
+
+class _Span:
+    __slots__ = ['tracer', 'stage', 'start']
+
+    def __init__(self, tracer, stage):
+        self.tracer = tracer
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.tracer.record(self.stage, self.start, perf_counter())
+
+
+class FrameTracer:
+    """
+    Timestamps each stage of each frame, from any thread, into a fixed-size ring buffer
+    Only the most recent `capacity` spans are kept, so tracing can stay on for a whole session
+    The buffer can be summarized per stage (live overlay) or dumped in the Chrome trace event format,
+        which chrome://tracing, Perfetto or speedscope show as a flame graph per thread
+    """
+    def __init__(self, capacity=16384, stages=STAGES):
+        self.stages = list(stages)
+        self._stage_ids = {stage: i for i, stage in enumerate(self.stages)}
+        self.spans = np.zeros(capacity, dtype=SPAN_DTYPE)
+        self.count = 0  # total number of spans recorded, the buffer holds the last `capacity` of them
+        self.threads = []  # names of the threads that recorded spans, indexed by the spans' `thread`
+
+        self._thread_ids = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def new_frame(self):
+        # Start a new frame of the calling thread, the following spans belong to it
+        self._local.frame = getattr(self._local, 'frame', -1) + 1
+
+    def span(self, stage):
+        # Context manager timing the enclosed code as `stage` of the current frame
+        return _Span(self, stage)
+
+    def record(self, stage, start, end):
+        frame = getattr(self._local, 'frame', 0)
+        ident = threading.get_ident()
+        with self._lock:
+            thread = self._thread_ids.get(ident)
+            if thread is None:
+                thread = self._thread_ids[ident] = len(self.threads)
+                self.threads.append(threading.current_thread().name)
+            self.spans[self.count % len(self.spans)] = (self._stage_ids[stage], thread, frame, start, end)
+            self.count += 1
+
+    def recent(self):
+        # Recorded spans still in the buffer, oldest first
+        with self._lock:
+            if self.count <= len(self.spans):
+                return self.spans[:self.count].copy()
+            i = self.count % len(self.spans)
+            return np.concatenate([self.spans[i:], self.spans[:i]])
+
+    def summary(self, window=1.0):
+        """
+        Average time spent in each stage per frame, over the last `window` seconds
+        :return: {stage: milliseconds per frame}, only stages recorded during the window
+        """
+        spans = self.recent()
+        spans = spans[spans['end'] >= perf_counter() - window]
+        stats = {}
+        for i, stage in enumerate(self.stages):
+            stage_spans = spans[spans['stage'] == i]
+            if len(stage_spans) == 0:
+                continue
+            durations = stage_spans['end'] - stage_spans['start']
+            # Stages that run several times per frame (e.g. physics ticks) are summed per frame
+            num_frames = len(np.unique(stage_spans[['thread', 'frame']]))
+            stats[stage] = float(durations.sum() / num_frames * 1000)
+        return stats
+
+    def save_chrome_trace(self, path):
+        """
+        Write the buffer as a Chrome trace (JSON), one complete ("X") event per span
+        """
+        spans = self.recent()
+        origin = spans['start'].min() if len(spans) else 0.
+        events = [
+            {'name': 'thread_name', 'ph': 'M', 'pid': 0, 'tid': i, 'args': {'name': name}}
+            for i, name in enumerate(self.threads)
+        ]
+        for span in spans:
+            events.append({
+                'name': self.stages[span['stage']],
+                'ph': 'X',
+                'pid': 0,
+                'tid': int(span['thread']),
+                'ts': (span['start'] - origin) * 1e6,  # microseconds
+                'dur': (span['end'] - span['start']) * 1e6,
+                'args': {'frame': int(span['frame'])}
+            })
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+
+
+class NullTracer:
+    """
+    Stand-in for FrameTracer when tracing is disabled, records nothing
+    """
+    _span = nullcontext()
+
+    def new_frame(self):
+        pass
+
+    def span(self, stage):
+        return self._span
+
+
+def draw_trace_overlay(surface, font, tracer, budget_ms, position=(20, 40)):
+    """
+    Draw one bar per stage, showing the time it takes per frame relative to the frame budget
+    :param surface: pygame surface to draw on
+    :param font: pygame font used for the labels
+    :param tracer: FrameTracer to summarize
+    :param budget_ms: time available per rendered frame, i.e. the full width of the bars
+    """
+    import pygame
+
+    x, y = position
+    bar_width, line_height = 200, font.get_linesize() + 2
+    for stage, ms in tracer.summary().items():
+        label = font.render(f'{stage:<10} {ms:6.2f} ms', True, (255, 255, 255), (0, 0, 0))
+        surface.blit(label, (x, y))
+        bar_x = x + label.get_width() + 8
+        pygame.draw.rect(surface, (0, 0, 0), (bar_x, y, bar_width, line_height - 2), 1)
+        fill = int(min(ms / budget_ms, 1.) * bar_width)
+        color = (203, 96, 21) if ms < budget_ms else (200, 0, 0)
+        pygame.draw.rect(surface, color, (bar_x, y, fill, line_height - 2))
+        y += line_height
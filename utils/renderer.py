@@ -0,0 +1,145 @@
+import pygame
+
+
+class TextCache:
+    """
+    Rendered text surfaces, kept for the small set of strings a game displays over and over (e.g. action labels)
+    """
+    def __init__(self, font, color, background=None, max_size=256):
+        self.font = font
+        self.color = color
+        self.background = background
+        self.max_size = max_size
+        self._surfaces = {}
+
+    def get(self, text):
+        surface = self._surfaces.get(text)
+        if surface is None:
+            if len(self._surfaces) >= self.max_size:
+                self._surfaces.clear()
+            surface = self._surfaces[text] = self.font.render(text, True, self.color, self.background)
+        return surface
+
+
+class GlyphCache(TextCache):
+    """
+    Rendered surfaces of single characters, for text that changes every frame (e.g. FPS counters)
+    Any string is laid out from the few glyphs it uses, so nothing is rendered with the font after the first frames
+    """
+    def layout(self, text, position):
+        """
+        :return: list of (glyph surface, position) drawing `text` with its top left corner at `position`
+        """
+        x, y = position
+        glyphs = []
+        for char in text:
+            surface = self.get(char)
+            glyphs.append((surface, (x, y)))
+            x += surface.get_width()
+        return glyphs
+
+
+class DirtyRectRenderer:
+    """
+    Redraws and updates only the parts of the window that changed since the previous frame
+    Each frame, the scene is described with `draw_rect` and `blit`, then `render` compares it with the previous
+        frame: changed items are erased to the background, everything overlapping them is redrawn, and `flip`
+        passes only those regions to `pygame.display.update`
+    Everything drawn must be opaque and drawn through the renderer, anything else requires `invalidate`
+    """
+    def __init__(self, window, background=(255, 255, 255), full_update_fraction=0.5):
+        """
+        :param window: display surface
+        :param background: background color
+        :param full_update_fraction: when the dirty area exceeds this fraction of the window, the whole window
+            is updated at once, which is cheaper than many large rectangles
+        """
+        self.window = window
+        self.background = background
+        self.full_update_fraction = full_update_fraction
+        self.window_rect = window.get_rect()
+        self.window_area = self.window_rect.w * self.window_rect.h
+
+        self._items = []  # items of the frame being described: (key, rect, draw arguments)
+        self._prev_items = []
+        self._dirty = []
+        self._full = True  # the first frame is drawn in full
+
+    def invalidate(self):
+        # Redraw and update the whole window on the next frame
+        self._full = True
+
+    def draw_rect(self, color, rect):
+        # Clipped to the window: off-screen rectangles are skipped, and `fill` misplaces partially
+        #   off-screen rectangles
+        rect = pygame.Rect(rect).clip(self.window_rect)
+        if rect.w == 0 or rect.h == 0:
+            return
+        self._items.append(((tuple(color), tuple(rect)), rect, (tuple(color), None)))
+
+    def blit(self, surface, position):
+        rect = surface.get_rect(topleft=position)
+        self._items.append(((id(surface), tuple(rect)), rect, (None, surface)))
+
+    def blit_glyphs(self, glyphs):
+        # Glyphs laid out by `GlyphCache.layout`
+        for surface, position in glyphs:
+            self.blit(surface, position)
+
+    def _draw(self, rect, args):
+        color, surface = args
+        if surface is None:
+            self.window.fill(color, rect)
+        else:
+            self.window.blit(surface, rect)
+
+    @staticmethod
+    def _merge(rects):
+        # Overlapping rectangles (e.g. old and new position of a moving item) are merged, so that the
+        #   region is erased, redrawn and updated once
+        merged = []
+        for rect in rects:
+            rect = rect.copy()
+            hits = rect.collidelistall(merged)
+            while hits:
+                for i in reversed(hits):
+                    rect.union_ip(merged.pop(i))
+                hits = rect.collidelistall(merged)
+            merged.append(rect)
+        return merged
+
+    def render(self):
+        # Draw the described frame onto the window
+        items, self._items = self._items, []
+        if self._full:
+            self.window.fill(self.background)
+            for _, rect, args in items:
+                self._draw(rect, args)
+            self._dirty = None
+        else:
+            prev_keys = {key for key, _, _ in self._prev_items}
+            keys = {key for key, _, _ in items}
+            # Items that disappeared or moved, and items that appeared or changed
+            dirty = [rect for key, rect, _ in self._prev_items if key not in keys]
+            dirty += [rect for key, rect, _ in items if key not in prev_keys]
+            dirty = self._merge(dirty)
+
+            # Redraw each dirty region clipped to itself, so that overlapping items keep their stacking order
+            rects = [rect for _, rect, _ in items]
+            for dirty_rect in dirty:
+                self.window.set_clip(dirty_rect)
+                self.window.fill(self.background, dirty_rect)
+                for i in dirty_rect.collidelistall(rects):
+                    self._draw(rects[i], items[i][2])
+            self.window.set_clip(None)
+            self._dirty = dirty
+
+        self._prev_items = items
+
+    def flip(self):
+        # Update the changed regions of the display
+        dirty, self._full = self._dirty, False
+        if dirty is None or sum(rect.w * rect.h for rect in dirty) > self.full_update_fraction * self.window_area:
+            pygame.display.update()
+        elif dirty:
+            pygame.display.update(dirty)
@@ -0,0 +1,182 @@
+import csv
+import json
+import time
+import itertools
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+from utils.predictors import KNNClassifier, export_classifier
+
+
+# Classifier families and the values tried for each hyperparameter
+DEFAULT_GRID = {
+    'svc': {'gamma': [0.5, 1, 2, 4], 'C': [0.5, 1, 4]},
+    'knn': {'n_neighbors': [1, 3, 5, 9]},
+    'linear': {'C': [0.1, 1, 10, 100]}
+}
+
+
+def build_classifier(family, params):
+    # sklearn is only imported in the processes that actually fit models
+    if family == 'svc':
+        from sklearn.svm import SVC
+        return SVC(**params)
+    if family == 'knn':
+        return KNNClassifier(**params)
+    if family == 'linear':
+        from sklearn.linear_model import LogisticRegression
+        return LogisticRegression(max_iter=2000, **params)
+    raise ValueError(f'Unknown classifier family `{family}`')
+
+
+def list_candidates(grid=None, n_iter=None, seed=0):
+    """
+    Every combination of hyperparameters of the grid (grid search), or a random subset of them (random search)
+    :param grid: {family: {hyperparameter: list of values}}, defaults to DEFAULT_GRID
+    :param n_iter: number of candidates to sample, None to try them all
+    :return: list of (family, params)
+    """
+    grid = DEFAULT_GRID if grid is None else grid
+    candidates = []
+    for family, space in grid.items():
+        names = sorted(space)
+        for values in itertools.product(*(space[name] for name in names)):
+            candidates.append((family, dict(zip(names, values))))
+
+    if n_iter is not None and n_iter < len(candidates):
+        rng = np.random.default_rng(seed)
+        candidates = [candidates[i] for i in sorted(rng.choice(len(candidates), n_iter, replace=False))]
+    return candidates
+
+
+def k_fold_indices(labels, k=5, seed=0):
+    """
+    Stratified k-fold split: every class is spread evenly over the folds
+    :return: list of k (train indices, validation indices)
+    """
+    rng = np.random.default_rng(seed)
+    folds = [[] for _ in range(k)]
+    for class_ in np.unique(labels):
+        indices = rng.permutation(np.flatnonzero(labels == class_))
+        for fold, part in zip(folds, np.array_split(indices, k)):
+            fold.append(part)
+
+    folds = [np.concatenate(fold) for fold in folds]
+    return [
+        (np.concatenate(folds[:i] + folds[i + 1:]), folds[i])
+        for i in range(k)
+    ]
+
+
+# The landmark matrix is sent to each worker process once, not with every candidate
+_worker_data = None
+
+
+def _init_worker(X, y, folds):
+    global _worker_data
+    _worker_data = X, y, folds
+
+
+def _evaluate(candidate):
+    # Cross-validate a candidate, then fit it on all the data for latency measurement
+    family, params = candidate
+    X, y, folds = _worker_data
+
+    scores, fit_times = [], []
+    for train, val in folds:
+        clf = build_classifier(family, params)
+        start = time.perf_counter()
+        clf.fit(X[train], y[train])
+        fit_times.append(time.perf_counter() - start)
+        scores.append(np.mean(clf.predict(X[val]) == y[val]))
+
+    clf = build_classifier(family, params).fit(X, y)
+    return {
+        'family': family,
+        'params': params,
+        'accuracy': float(np.mean(scores)),
+        'accuracy_std': float(np.std(scores)),
+        'fit_ms': float(np.mean(fit_times) * 1000)
+    }, export_classifier(clf)
+
+
+def measure_latency(predictor, X, num_samples=200, warmup=10):
+    """
+    Per-sample inference latency, predicting one landmark vector at a time as during the game
+    :return: median latency in milliseconds
+    """
+    rows = [X[i:i + 1] for i in np.resize(np.arange(len(X)), num_samples)]
+    for row in rows[:warmup]:
+        predictor.predict(row)
+
+    latencies = []
+    for row in rows:
+        start = time.perf_counter()
+        predictor.predict(row)
+        latencies.append(time.perf_counter() - start)
+    return float(np.median(latencies) * 1000)
+
+
+def model_search(X, y, grid=None, k=5, n_iter=None, num_workers=None, seed=0):
+    """
+    Cross-validate every candidate classifier in parallel, then measure each one's inference latency
+    Latencies are measured in this process, one model at a time, so they are not skewed by the search itself
+    :param X: (N, 63) landmark vectors
+    :param y: N integer labels
+    :param grid: search space, see `list_candidates`
+    :param k: number of cross-validation folds
+    :param n_iter: number of randomly sampled candidates, None for a full grid search
+    :param num_workers: number of processes, defaults to the number of cores
+    :return: list of results (dicts), list of the corresponding fitted NumPy-only predictors
+    """
+    candidates = list_candidates(grid, n_iter, seed)
+    folds = k_fold_indices(y, k, seed)
+
+    with ProcessPoolExecutor(num_workers, initializer=_init_worker, initargs=(X, y, folds)) as executor:
+        outputs = list(executor.map(_evaluate, candidates))
+
+    results, predictors = [], []
+    for result, predictor in outputs:
+        result['latency_ms'] = measure_latency(predictor, X)
+        results.append(result)
+        predictors.append(predictor)
+    return results, predictors
+
+
+def select_model(results, accuracy_target):
+    """
+    Fastest candidate whose accuracy meets the target, the most accurate one if none does
+    :return: index of the selected result
+    """
+    meeting = [i for i, result in enumerate(results) if result['accuracy'] >= accuracy_target]
+    if meeting:
+        return min(meeting, key=lambda i: results[i]['latency_ms'])
+    return max(range(len(results)), key=lambda i: results[i]['accuracy'])
+
+
+def save_report(results, path, selected=None):
+    # JSON keeps the full results, CSV has one row per candidate for spreadsheets
+    if path.endswith('.csv'):
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['family', 'params', 'accuracy', 'accuracy_std', 'fit_ms', 'latency_ms', 'selected'])
+            for i, result in enumerate(results):
+                writer.writerow([
+                    result['family'], json.dumps(result['params']), result['accuracy'], result['accuracy_std'],
+                    result['fit_ms'], result['latency_ms'], i == selected
+                ])
+    else:
+        with open(path, 'w') as f:
+            json.dump({'results': results, 'selected': selected}, f, indent=2)
+
+
+def print_report(results, selected=None):
+    print(f'{"family":<8}{"params":<28}{"accuracy":>10}{"std":>8}{"fit ms":>10}{"predict ms":>12}')
+    for i in sorted(range(len(results)), key=lambda i: -results[i]['accuracy']):
+        result = results[i]
+        params = ', '.join(f'{name}={value}' for name, value in result['params'].items())
+        marker = ' *' if i == selected else ''
+        print(
+            f'{result["family"]:<8}{params:<28}{result["accuracy"]:>10.4f}{result["accuracy_std"]:>8.4f}'
+            f'{result["fit_ms"]:>10.1f}{result["latency_ms"]:>12.4f}{marker}'
+        )
@@ -0,0 +1,179 @@
+import numpy as np
+
+from utils.game import Player, EnemyField
+from utils.levels import segment_geometry
+from utils.profiling import NullTracer
+
+
+# Bits of the per-tick actions stored in input traces
+LEFT, RIGHT, UP, DOWN = 1, 2, 4, 8
+
+
+class FixedTimestep:
+    """
+    Accumulates elapsed real time and converts it into a whole number of fixed simulation ticks,
+        so that game speed does not depend on how fast frames are rendered
+    """
+    def __init__(self, tick_rate=60, max_ticks=5):
+        """
+        :param tick_rate: simulation ticks per second
+        :param max_ticks: maximum number of ticks per update; lag beyond that is dropped instead of
+            making every following frame slower
+        """
+        self.dt = 1 / tick_rate
+        self.max_ticks = max_ticks
+        self.accumulator = 0.
+
+    def advance(self, elapsed):
+        """
+        :param elapsed: real time since the last call, in seconds
+        :return: number of ticks to simulate
+        """
+        self.accumulator += elapsed
+        ticks = int(self.accumulator // self.dt)
+        if ticks > self.max_ticks:
+            ticks, self.accumulator = self.max_ticks, 0.
+        else:
+            self.accumulator -= ticks * self.dt
+        return ticks
+
+
+class GameSimulation:
+    """
+    Game physics and level logic, advanced one fixed tick at a time and independent of pygame rendering
+    Runs headless, so levels can be replayed much faster than real time
+    """
+    def __init__(self,
+                 level,
+                 window_size=(600, 1000),
+                 tick_rate=60,
+                 player_size=(50, 50),
+                 player_acc=0.2,
+                 tracer=None,
+                 num_players=1):
+        """
+        :param level: LevelStream handing out the enemies' spawn segments (see `utils.levels.load_level`)
+        :param window_size: size of the playing field
+        :param tick_rate: simulation ticks per second
+        :param player_size: width and height of the player
+        :param player_acc: player acceleration, per tick
+        :param tracer: optional FrameTracer timing the physics and enemies stages of each tick
+        :param num_players: number of players, spread evenly across the field; the game goes on
+            until every player has collided
+        """
+        self.window_size = list(window_size)
+        self.tick_rate = tick_rate
+
+        width, height = player_size
+        self.players = [
+            Player(
+                x=window_size[0] * (i + 1) // (num_players + 1) - width // 2,
+                y=window_size[1] // 2 - height // 2,
+                width=width, height=height,
+                ax=player_acc, window_size=self.window_size
+            )
+            for i in range(num_players)
+        ]
+        self.player = self.players[0]
+        self.players_alive = [True] * num_players
+        self.level = level
+        self.enemies = EnemyField(self.window_size)
+
+        self.tick = 0
+        self.alive = True
+        self.tracer = NullTracer() if tracer is None else tracer
+
+    @property
+    def finished(self):
+        # Every enemy of the level has been spawned and has left the screen
+        return self.level.finished and len(self.enemies) == 0
+
+    @property
+    def time(self):
+        return self.tick / self.tick_rate
+
+    @property
+    def time_ms(self):
+        return self.tick * 1000 / self.tick_rate
+
+    def step(self, left=False, right=False, up=False, down=False):
+        """
+        Advance the game by one tick
+        :return: False once the player collided with an enemy
+        """
+        return self.step_players([(left, right, up, down)])
+
+    def step_players(self, inputs):
+        """
+        Advance the game by one tick, with one input per player
+        :param inputs: (left, right) or (left, right, up, down) of each player, players without input
+            don't accelerate
+        :return: False once every player collided with an enemy
+        """
+        if not self.alive:
+            return False
+        self.tick += 1
+
+        # Spawn new enemies; update enemies, delete if out of bound
+        with self.tracer.span('enemies'):
+            segments = self.level.pop_due(self.time_ms)
+            if len(segments) > 0:
+                self.enemies.add(segment_geometry(segments))
+            self.enemies.step()
+
+        # Move players; collision detection of every player in one pass, collided players leave the game
+        with self.tracer.span('physics'):
+            alive = [i for i, player_alive in enumerate(self.players_alive) if player_alive]
+            rects = []
+            for i in alive:
+                player = self.players[i]
+                player.update_pos(*(inputs[i] if i < len(inputs) else (False, False)))
+                rects.append((player.x, player.y, player.width, player.height))
+            for i, hit in zip(alive, self.enemies.collisions(rects)):
+                if hit:
+                    self.players_alive[i] = False
+            self.alive = any(self.players_alive)
+        return self.alive
+
+    def run(self, actions=None, max_ticks=None):
+        """
+        Run until the player collides, the level is finished, or `max_ticks` is reached
+        :param actions: per-tick actions (see `encode_action`), (ticks, players) for several players;
+            no input is given after the trace ends
+        :param max_ticks: maximum number of ticks to simulate
+        :return: dict with the outcome of the run
+        """
+        actions = np.zeros((0, len(self.players)), dtype='uint8') if actions is None else actions
+        if actions.ndim == 1:
+            actions = actions[:, None]
+        no_input = np.zeros(actions.shape[1], dtype='uint8')
+        while self.alive and not self.finished and (max_ticks is None or self.tick < max_ticks):
+            tick_actions = actions[self.tick] if self.tick < len(actions) else no_input
+            self.step_players([decode_action(action) for action in tick_actions])
+
+        return {
+            'ticks': self.tick,
+            'time': self.time,
+            'survived': self.alive,
+            'players_survived': sum(self.players_alive),
+            'finished': self.finished,
+            'spawned': self.level.spawned
+        }
+
+
+def encode_action(left, right, up=False, down=False):
+    return (LEFT if left else 0) | (RIGHT if right else 0) | (UP if up else 0) | (DOWN if down else 0)
+
+
+def decode_action(action):
+    # (left, right, up, down) of an encoded action
+    return bool(action & LEFT), bool(action & RIGHT), bool(action & UP), bool(action & DOWN)
+
+
+def save_input_trace(actions, path):
+    # Input traces store one action per simulation tick, (ticks, players) for several players
+    np.save(path, np.asarray(actions, dtype='uint8'))
+
+
+def load_input_trace(path):
+    return np.load(path)
@@ -0,0 +1,201 @@
+import os
+import time
+from abc import ABC, abstractmethod
+import cv2
+import numpy as np
+
+
+class FrameSource(ABC):
+    """
+    Base class for frame sources, mirrors the `read`/`release` interface of cv2.VideoCapture
+    Recorded sources can either be paced to their frame rate (real time) or read as fast as possible
+    """
+    def __init__(self, fps=30, realtime=True, loop=False):
+        """
+        :param fps: frame rate used for real-time pacing
+        :param realtime: whether to pace frames to `fps`, otherwise frames are returned as fast as possible
+        :param loop: whether to restart from the first frame at the end of the recording
+        """
+        self.fps = fps
+        self.realtime = realtime
+        self.loop = loop
+        self.frame_count = 0  # number of frames returned so far
+        self._next_time = None
+
+    @abstractmethod
+    def _read(self):
+        # Return the next frame (BGR), or None at the end of the source
+        pass
+
+    @abstractmethod
+    def _rewind(self):
+        # Go back to the first frame, called at the end of looping sources
+        pass
+
+    def read(self):
+        frame = self._read()
+        if frame is None and self.loop:
+            self._rewind()
+            frame = self._read()
+        if frame is None:
+            return False, None
+
+        if self.realtime and self.fps:
+            self._wait()
+        self.frame_count += 1
+        return True, frame
+
+    def _wait(self):
+        now = time.perf_counter()
+        if self._next_time is None or now - self._next_time > 1 / self.fps:
+            # First frame, or the consumer fell behind: don't try to catch up with a burst of frames
+            self._next_time = now
+        elif self._next_time > now:
+            time.sleep(self._next_time - now)
+        self._next_time += 1 / self.fps
+
+    def release(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
+
+
+class CameraSource(FrameSource):
+    """
+    Live camera, paced by the camera itself
+    """
+    def __init__(self, index=0):
+        super().__init__(realtime=False)
+        self.capture = cv2.VideoCapture(index)
+
+    def _read(self):
+        ret, frame = self.capture.read()
+        return frame if ret else None
+
+    def _rewind(self):
+        # Never called, cameras are not looping sources
+        raise ValueError('A camera can not be rewound')
+
+    def release(self):
+        self.capture.release()
+
+
+class VideoFileSource(FrameSource):
+    """
+    Recorded video file, paced to the frame rate stored in the file by default
+    """
+    def __init__(self, path, fps=None, realtime=True, loop=False):
+        self.path = path
+        self.capture = cv2.VideoCapture(path)
+        if not self.capture.isOpened():
+            raise ValueError(f'Could not open video file `{path}`')
+        fps = fps or self.capture.get(cv2.CAP_PROP_FPS) or 30
+        super().__init__(fps, realtime, loop)
+
+    def _read(self):
+        ret, frame = self.capture.read()
+        return frame if ret else None
+
+    def _rewind(self):
+        self.capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+
+    def release(self):
+        self.capture.release()
+
+
+class ImageDirectorySource(FrameSource):
+    """
+    Directory of image files, read in sorted order
+    """
+    extensions = ('.jpg', '.jpeg', '.png', '.bmp')
+
+    def __init__(self, directory, fps=30, realtime=True, loop=False):
+        super().__init__(fps, realtime, loop)
+        self.paths = [
+            os.path.join(directory, name) for name in sorted(os.listdir(directory))
+            if name.lower().endswith(self.extensions)
+        ]
+        self._index = 0
+
+    def _read(self):
+        if self._index >= len(self.paths):
+            return None
+        frame = cv2.imread(self.paths[self._index])
+        self._index += 1
+        return frame
+
+    def _rewind(self):
+        self._index = 0
+
+
+class RawFrameSource(FrameSource):
+    """
+    Memory-mapped dump of raw uint8 BGR frames, either an .npy file of shape (N, H, W, 3)
+        or a headerless file, in which case `frame_shape` (H, W, 3) must be given
+    Frames are never decoded, which makes this the cheapest source for throughput tests
+    """
+    def __init__(self, path, frame_shape=None, fps=30, realtime=True, loop=False):
+        super().__init__(fps, realtime, loop)
+        if path.endswith('.npy'):
+            self.frames = np.load(path, mmap_mode='r')
+        else:
+            if frame_shape is None:
+                raise ValueError('`frame_shape` is required for headerless frame dumps')
+            self.frames = np.memmap(path, dtype='uint8', mode='r').reshape(-1, *frame_shape)
+        self._index = 0
+
+    def __len__(self):
+        return len(self.frames)
+
+    def _read(self):
+        if self._index >= len(self.frames):
+            return None
+        frame = np.asarray(self.frames[self._index])
+        self._index += 1
+        return frame
+
+    def _rewind(self):
+        self._index = 0
+
+
+def open_source(source=0, fps=None, realtime=True, loop=False, frame_shape=None):
+    """
+    Open a frame source from a camera index or a path
+    :param source: camera index (int or digit string), video file, directory of images, or raw frame dump (.npy/.raw)
+    :param fps: frame rate used for pacing recorded sources, defaults to the recording's own rate (or 30)
+    :param realtime: whether to pace recorded sources to `fps`
+    :param loop: whether recorded sources restart at the end
+    :param frame_shape: (H, W, 3) of headerless raw frame dumps
+    :return: FrameSource
+    """
+    if isinstance(source, int) or str(source).isdigit():
+        if loop:
+            raise ValueError('Only recorded sources can be looped, not cameras')
+        return CameraSource(int(source))
+
+    if os.path.isdir(source):
+        return ImageDirectorySource(source, fps or 30, realtime, loop)
+    if source.endswith(('.npy', '.raw')):
+        return RawFrameSource(source, frame_shape, fps or 30, realtime, loop)
+    return VideoFileSource(source, fps, realtime, loop)
+
+
+def record_frames(source, path, max_frames=None):
+    """
+    Dump the frames of a source into an .npy file that can be replayed with `RawFrameSource`
+    :param source: FrameSource (or cv2.VideoCapture) to record from
+    :param path: .npy file to write
+    :param max_frames: maximum number of frames to record
+    :return: number of frames recorded
+    """
+    frames = []
+    ret, frame = source.read()
+    while ret and (max_frames is None or len(frames) < max_frames):
+        frames.append(frame)
+        ret, frame = source.read()
+    np.save(path, np.asarray(frames, dtype='uint8'))
+    return len(frames)
@@ -0,0 +1,142 @@
+import numpy as np
+
+
+class HandROITracker:
+    """
+    Region-of-interest tracking between frames: MediaPipe only processes a padded square around the
+        hand found in the previous frame, and falls back to the full frame when the hand is lost
+    Landmarks found in the crop are mapped back to full-frame coordinates, so the classifier sees
+        the same features either way
+    """
+    def __init__(self, padding=0.35, min_size=64, max_fraction=0.8):
+        """
+        :param padding: margin added around the landmarks' bounding box, relative to its size
+        :param min_size: minimum side of the region, in pixels
+        :param max_fraction: regions larger than this fraction of the frame's shorter side are not
+            worth cropping, the full frame is used instead
+        """
+        self.padding = padding
+        self.min_size = min_size
+        self.max_fraction = max_fraction
+        self.roi = None  # (x0, y0, x1, y1) in pixels, None when the hand is not tracked
+
+        # Statistics
+        self.roi_hits = 0  # frames in which the hand was found in the region
+        self.full_searches = 0  # frames processed at full size
+        self.pixels_processed = 0
+        self.pixels_full = 0  # pixels that would have been processed without tracking
+
+    def reset(self):
+        self.roi = None
+
+    def image2vec(self, recognizer, image, train=True, out=None):
+        """
+        Same as `GestureRecognizer.image2vec`, but searching the tracked region first
+        :param recognizer: GestureRecognizer used for landmark extraction
+        :param image: full RGB frame
+        :return: 1-D float32 array in full-frame coordinates, None if no hand is detected
+        """
+        h, w = image.shape[:2]
+        self.pixels_full += h * w
+
+        if self.roi is not None:
+            x0, y0, x1, y1 = self.roi
+            crop = np.ascontiguousarray(image[y0:y1, x0:x1])
+            self.pixels_processed += crop.shape[0] * crop.shape[1]
+            vec = recognizer.image2vec(crop, train=train, out=out)
+            if vec is not None:
+                self._to_frame(vec, x0, y0, x1 - x0, y1 - y0, w, h)
+                self._update(vec, w, h)
+                self.roi_hits += 1
+                return vec
+            # Tracking lost, search the whole frame
+            self.roi = None
+
+        self.full_searches += 1
+        self.pixels_processed += h * w
+        vec = recognizer.image2vec(image, train=train, out=out)
+        if vec is not None:
+            self._update(vec, w, h)
+        return vec
+
+    @staticmethod
+    def _to_frame(vec, x0, y0, crop_w, crop_h, w, h):
+        # Landmarks are normalized to the crop, z uses roughly the same scale as x
+        vec[0::3] = (vec[0::3] * crop_w + x0) / w
+        vec[1::3] = (vec[1::3] * crop_h + y0) / h
+        vec[2::3] *= crop_w / w
+
+    def _update(self, vec, w, h):
+        xs, ys = vec[0::3] * w, vec[1::3] * h
+        size = max(xs.max() - xs.min(), ys.max() - ys.min()) * (1 + 2 * self.padding)
+        size = int(max(size, self.min_size))
+        if size > self.max_fraction * min(w, h):
+            self.roi = None
+            return
+
+        # Square region centered on the hand, shifted to stay inside the frame
+        cx, cy = (xs.max() + xs.min()) / 2, (ys.max() + ys.min()) / 2
+        x0 = int(np.clip(cx - size / 2, 0, w - size))
+        y0 = int(np.clip(cy - size / 2, 0, h - size))
+        self.roi = (x0, y0, x0 + size, y0 + size)
+
+    @property
+    def pixel_ratio(self):
+        # Fraction of the full-frame pixels actually processed
+        return self.pixels_processed / self.pixels_full if self.pixels_full else 1.
+
+
+class HandAssigner:
+    """
+    Assigns the hands detected in each frame to players, keeping the same player for the same hand over time
+    Each hand is matched to the player whose hand was last seen closest to its wrist; a player whose hand
+        disappears keeps their place for `timeout` seconds, so a briefly lost hand gets its player back
+    New hands take the free players in order from left to right
+    """
+    def __init__(self, num_players, max_distance=0.25, timeout=1.0):
+        """
+        :param num_players: number of players, i.e. of hands followed
+        :param max_distance: largest wrist movement between two frames (normalized image coordinates)
+            for which a hand is still considered the same
+        :param timeout: seconds after which a player whose hand is not seen becomes free
+        """
+        self.num_players = num_players
+        self.max_distance = max_distance
+        self.timeout = timeout
+        self.positions = np.zeros((num_players, 2))  # last wrist position of each player's hand
+        self.last_seen = np.full(num_players, -np.inf)
+
+    def reset(self):
+        self.last_seen[:] = -np.inf
+
+    def assign(self, vecs, timestamp):
+        """
+        :param vecs: (k, 63) landmark vectors of the hands detected in a frame
+        :param timestamp: time of the frame, in seconds
+        :return: array with the index (in `vecs`) of each player's hand, -1 for players whose hand is not visible
+        """
+        assignment = np.full(self.num_players, -1, dtype='int64')
+        wrists = np.asarray(vecs[:, :2], dtype='float64')  # landmark 0 is the wrist
+        active = self.last_seen >= timestamp - self.timeout
+
+        # Greedy matching of the closest (player, hand) pairs
+        dists = np.linalg.norm(self.positions[:, None] - wrists[None], axis=2)
+        dists[~active] = np.inf
+        matched = np.zeros(len(wrists), dtype=bool)
+        for flat in np.argsort(dists, axis=None):
+            player, hand = divmod(int(flat), len(wrists))
+            if dists[player, hand] > self.max_distance:
+                break
+            if assignment[player] < 0 and not matched[hand]:
+                assignment[player], matched[hand] = hand, True
+
+        # Unmatched hands go to free players, from left to right
+        free = [player for player in range(self.num_players) if not active[player]]
+        new_hands = sorted(np.flatnonzero(~matched), key=lambda hand: wrists[hand, 0])
+        for player, hand in zip(free, new_hands):
+            assignment[player] = hand
+
+        seen = assignment >= 0
+        self.positions[seen] = wrists[assignment[seen]]
+        self.last_seen[seen] = timestamp
+        return assignment
@@ -0,0 +1,197 @@
+import os
+import threading
+from collections import deque
+from datetime import datetime
+from uuid import uuid4
+import cv2
+
+
+class JpegSink:
+    """
+    Saves each image as a JPEG file in the directory of its class
+    File names are created based on generated time and unique ID
+    """
+    def __init__(self, save_dir):
+        self.save_dir = save_dir
+        self.time_stamp = datetime.now().strftime('%Y%m-%d%H-%M-')
+
+    def save(self, image, label):
+        path = os.path.join(self.save_dir, str(label), self.time_stamp + str(uuid4()) + '.jpg')
+        # OpenCV saves image in BGR format, and reports failures by returning False
+        if not cv2.imwrite(path, cv2.cvtColor(image, cv2.COLOR_RGB2BGR)):
+            raise IOError(f'Could not write image `{path}`')
+        return path
+
+    def delete(self, handle):
+        os.remove(handle)
+        return True
+
+    def flush(self):
+        pass
+
+
+class PackedSink:
+    """
+    Appends images to a PackedDataset, one shard at a time
+    Images are held until a full shard is collected (or `flush` is called), shards can't be edited afterwards
+    """
+    def __init__(self, packed):
+        self.packed = packed
+        self._buffer = []  # (handle, image, label)
+        self._lock = threading.Lock()
+        self._next_handle = 0
+
+    def save(self, image, label):
+        with self._lock:
+            handle = self._next_handle
+            self._next_handle += 1
+            self._buffer.append((handle, image, label))
+            if len(self._buffer) >= self.packed.shard_size:
+                self._write()
+        return handle
+
+    def delete(self, handle):
+        with self._lock:
+            for i, (buffered, _, _) in enumerate(self._buffer):
+                if buffered == handle:
+                    self._buffer.pop(i)
+                    return True
+        return False
+
+    def flush(self):
+        with self._lock:
+            self._write()
+
+    def _write(self):
+        if self._buffer:
+            self.packed.append([image for _, image, _ in self._buffer], [label for _, _, label in self._buffer])
+            self._buffer = []
+
+
+class _Job:
+    def __init__(self, image, label):
+        self.image = image
+        self.label = label
+        self.handle = None
+        self.done = False
+        self.error = None  # exception raised while saving
+
+
+class AsyncImageWriter:
+    """
+    Encodes and saves images in background threads while collection goes on
+    Submitted images wait in a bounded queue: `submit` blocks while the queue is full (backpressure),
+        so memory stays bounded however long a session lasts
+    The last submitted images can be cancelled, whether they were already written or not
+    An error raised while saving an image is raised again by the next call to `submit`, `flush` or `close`
+    """
+    def __init__(self, sink, max_pending=64, num_workers=2):
+        """
+        :param sink: JpegSink or PackedSink, or any object with `save(image, label)`, `delete(handle)`, `flush()`
+        :param max_pending: maximum number of images waiting to be written
+        :param num_workers: number of writer threads (OpenCV releases the GIL while encoding)
+        """
+        self.sink = sink
+        self.max_pending = max_pending
+
+        self._pending = deque()
+        self._jobs = []  # every job of the session, most recent last, used for cancellation
+        self._in_progress = 0
+        self._cond = threading.Condition()
+        self._closed = False
+        self._error = None  # first error not reported yet
+        self.written = 0
+
+        self._threads = [
+            threading.Thread(target=self._work, name=f'writer-{i}', daemon=True) for i in range(num_workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def _raise_error(self):
+        # Called with the lock held
+        error, self._error = self._error, None
+        if error is not None:
+            raise error
+
+    def submit(self, image, label):
+        job = _Job(image, label)
+        with self._cond:
+            self._raise_error()
+            # Backpressure: wait for the writers to catch up
+            self._cond.wait_for(lambda: len(self._pending) < self.max_pending)
+            self._pending.append(job)
+            self._jobs.append(job)
+            self._cond.notify_all()
+
+    def cancel_last(self):
+        """
+        Remove the last submitted image: dropped if not written yet, deleted by the sink otherwise
+        :return: label of the removed image, None if there was nothing to remove
+        """
+        with self._cond:
+            if not self._jobs:
+                return None
+            job = self._jobs.pop()
+            if job in self._pending:
+                self._pending.remove(job)
+                self._cond.notify_all()
+                return job.label
+            # Currently being written, wait for it before deleting
+            self._cond.wait_for(lambda: job.done)
+
+        if job.error is not None:
+            # Never saved, nothing to delete
+            return job.label
+        if job.handle is None or not self.sink.delete(job.handle):
+            print('Last image was already saved and could not be deleted')
+            return None
+        self.written -= 1
+        return job.label
+
+    def _work(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._pending or self._closed)
+                if not self._pending:
+                    return
+                job = self._pending.popleft()
+                self._in_progress += 1
+                self._cond.notify_all()
+
+            # Errors are kept for the caller, the worker goes on with the next images
+            try:
+                job.handle = self.sink.save(job.image, job.label)
+            except Exception as e:
+                job.error = e
+            with self._cond:
+                job.image, job.done = None, True
+                self._in_progress -= 1
+                if job.error is None:
+                    self.written += 1
+                elif self._error is None:
+                    self._error = job.error
+                self._cond.notify_all()
+
+    @property
+    def pending(self):
+        return len(self._pending) + self._in_progress
+
+    def flush(self):
+        # Wait until every submitted image is written, then flush the sink
+        with self._cond:
+            self._cond.wait_for(lambda: not self._pending and self._in_progress == 0)
+            # Images of a finished session can no longer be cancelled
+            self._jobs = []
+            self._raise_error()
+        self.sink.flush()
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            with self._cond:
+                self._closed = True
+                self._cond.notify_all()
+            for thread in self._threads:
+                thread.join()